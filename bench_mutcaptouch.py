@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Simulation benchmark of CapTouch : cycles per frame, frames/s and FIFO occupancy
+#
+# Sweeps sizes, rise time distributions and timeouts, each point is a Migen simulation of a few
+# frames (mutcaptouch_model.simulate). Samples are checked against the model on the way.
+# Cycles are counted from the start write to status.done (capture only, FIFO reads by the CPU not
+# included), frames/s is the clock divided by the mean cycles per frame.
+#
+# Example :
+#   ./bench_mutcaptouch.py --sizes 4x1,8x8 --matrix --timeouts 64,256 --json bench.json
+#
+# Output is a table on stdout, and optionally JSON (list of points) and/or CSV (one line per point)
+# to compare frame rates between gateware changes.
+
+import argparse
+import csv
+import json
+import sys
+
+import numpy as np
+
+from mutcaptouch import CapTouch
+from mutcaptouch_model import CapTouchModel, simulate
+
+# Board clocks (iCE40UP5K at 12 MHz, faster FPGAs at 100 MHz)
+CLOCKS = [12e6, 100e6]
+
+# Rise time distributions, as a fraction of the timeout :
+#   fast    : all lines up in the first 1/8th of the timeout (no touch)
+#   uniform : anywhere before the timeout
+#   touch   : mostly fast, 20% of the lines slowed down to 1/2..1 of the timeout
+#   stuck   : uniform, 10% of the lines never going up (timeout reached)
+def rise_times(name, model, frames, rng):
+    t = model.timeout
+    shape = model.shape(frames)
+    if name == "fast":
+        return rng.integers(1, max(t//8, 2), size=shape)
+    if name == "uniform":
+        return rng.integers(1, t, size=shape)
+    if name == "touch":
+        rise = rng.integers(1, max(t//8, 2), size=shape)
+        slow = rng.random(shape) < 0.2
+        rise[slow] = rng.integers(t//2, t, size=shape)[slow]
+        return rise
+    if name == "stuck":
+        rise = rng.integers(1, t, size=shape)
+        rise[rng.random(shape) < 0.1] = t
+        return rise
+    raise ValueError("unknown distribution {}".format(name))
+
+DISTRIBUTIONS = ["fast", "uniform", "touch", "stuck"]
+
+
+def bench(num_lines, num_cols, matrix, timeout, dist, frames=4, oversampling=0, seed=0, vcd_name=None,
+          timestamps=False):
+    rng = np.random.default_rng(seed)
+    dut = CapTouch(num_lines, num_cols, matrix=matrix, max_timeout=timeout,
+                   max_oversampling=max(2**oversampling, 1), timestamps=timestamps)
+    model = CapTouchModel(num_lines, num_cols, matrix=matrix, max_timeout=timeout,
+                          max_oversampling=max(2**oversampling, 1))
+    model.oversampling = oversampling
+    rise = rise_times(dist, model, frames, rng)
+    words, cycles, levels = simulate(dut, model, rise, vcd_name=vcd_name)
+    errors = sum(list(e) != w for e, w in zip(model.words(rise), words))
+    mean = float(np.mean(cycles))
+    point = {
+        "num_lines": num_lines,
+        "num_cols": num_cols,
+        "matrix": matrix,
+        "timestamps": timestamps,
+        "timeout": timeout,
+        "oversampling": oversampling,
+        "distribution": dist,
+        "frames": frames,
+        "cycles_min": int(min(cycles)),
+        "cycles_mean": mean,
+        "cycles_max": int(max(cycles)),
+        "fifo_depth": dut.fifo.depth,
+        "fifo_max": int(max(levels)),
+        "errors": int(errors),
+    }
+    for clk in CLOCKS:
+        point["fps_{}mhz".format(int(clk/1e6))] = clk/mean
+    return point
+
+
+def size(s):
+    lines, cols = s.lower().split("x")
+    return int(lines), int(cols)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CapTouch simulation benchmark")
+    parser.add_argument("--sizes",        default="4x1,8x1,4x4",          help="Comma separated LINESxCOLS list")
+    parser.add_argument("--matrix",       action="store_true",            help="Matrix mode (one scan per column)")
+    parser.add_argument("--timeouts",     default="64,256",               help="Comma separated timeout list")
+    parser.add_argument("--dists",        default=",".join(DISTRIBUTIONS), help="Comma separated rise time distributions")
+    parser.add_argument("--timestamps",   action="store_true",            help="Edge timestamps in block RAM (CapTouch timestamps=True)")
+    parser.add_argument("--oversampling", default=0, type=int,            help="log2 of the captures per sample")
+    parser.add_argument("--frames",       default=4, type=int,            help="Frames simulated per point")
+    parser.add_argument("--seed",         default=0, type=int,            help="Random seed")
+    parser.add_argument("--vcd",          action="store_true",            help="Dump a VCD per point (slow)")
+    parser.add_argument("--json",         default=None,                   help="Write the results as JSON to this file")
+    parser.add_argument("--csv",          default=None,                   help="Write the results as CSV to this file")
+    args = parser.parse_args()
+
+    results = []
+    for s in args.sizes.split(","):
+        num_lines, num_cols = size(s)
+        for timeout in [int(t) for t in args.timeouts.split(",")]:
+            for dist in args.dists.split(","):
+                vcd_name = None
+                if args.vcd:
+                    vcd_name = "bench_{}x{}_{}_{}.vcd".format(num_lines, num_cols, timeout, dist)
+                point = bench(num_lines, num_cols, args.matrix, timeout, dist,
+                              frames=args.frames, oversampling=args.oversampling,
+                              seed=args.seed, vcd_name=vcd_name, timestamps=args.timestamps)
+                results.append(point)
+                print("{:>3}x{:<3} timeout {:>6} {:<8} cycles {:>8.1f} ({}..{})  {:>10.1f} fps@12MHz  {:>10.1f} fps@100MHz  fifo {}/{}{}".format(
+                    num_lines, num_cols, timeout, dist, point["cycles_mean"], point["cycles_min"], point["cycles_max"],
+                    point["fps_12mhz"], point["fps_100mhz"], point["fifo_max"], point["fifo_depth"],
+                    "  {} ERRORS".format(point["errors"]) if point["errors"] else ""))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+            writer.writeheader()
+            writer.writerows(results)
+    return 1 if any(p["errors"] for p in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPI flash image assembly shared by the board targets
+#
+# The image is a list of regions (offset, size, file), each file is padded with 0xff up to the size
+# of its region (erased flash). A file bigger than its region is an error, not truncated.
+# The last written image is kept next to the new one : regions identical to the previous image are
+# not rewritten nor reflashed.
+
+import os
+
+
+class ImageError(Exception):
+    pass
+
+
+def build_image(regions):
+    size = max(offset + length for offset, length, _ in regions)
+    image = bytearray(b"\xff"*size)
+    for offset, length, filename in sorted(regions):
+        with open(filename, "rb") as f:
+            data = f.read()
+        if len(data) > length:
+            raise ImageError("{} is {} bytes, region at 0x{:x} is only {} bytes".format(
+                filename, len(data), offset, length))
+        image[offset:offset + len(data)] = data
+    for (o0, l0, f0), (o1, l1, f1) in zip(sorted(regions), sorted(regions)[1:]):
+        if o0 + l0 > o1:
+            raise ImageError("regions of {} and {} overlap".format(f0, f1))
+    return bytes(image)
+
+
+# Regions of image which differ from the previous image (all of them when there is none)
+def changed_regions(regions, image, previous=None):
+    changed = []
+    for offset, length, filename in sorted(regions):
+        if previous is None or image[offset:offset + length] != previous[offset:offset + length]:
+            changed.append((offset, length, filename))
+    return changed
+
+
+# Assemble the image at path and flash the changed regions with prog (IceStormProgrammer)
+# full : flash the whole image even if unchanged (new board, flash content unknown)
+def flash_image(prog, regions, path, full=False):
+    image = build_image(regions)
+    previous = None
+    if os.path.exists(path) and not full:
+        with open(path, "rb") as f:
+            previous = f.read()
+        if len(previous) != len(image):
+            previous = None     # Layout changed
+    changed = changed_regions(regions, image, previous)
+    if not changed:
+        print("Flash image unchanged, nothing to flash (--flash-full to force)")
+        return []
+    with open(path, "wb") as f:
+        f.write(image)
+    try:
+        if len(changed) == len(regions):
+            print("Flashing full image ({} bytes)".format(len(image)))
+            prog.flash(0x0, path)
+        else:
+            for offset, length, filename in changed:
+                part = "{}.{:06x}".format(path, offset)
+                with open(part, "wb") as f:
+                    f.write(image[offset:offset + length])
+                print("Flashing {} at 0x{:06x}".format(filename, offset))
+                prog.flash(offset, part)
+    except BaseException:
+        # Flash content unknown, next flash will be a full one (on purpose also when interrupted, e.g. Ctrl-C
+        # in the middle of a region)
+        os.remove(path)
+        raise
+    return changed
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Host receiver of the binary frames streamed by the firmware (hmc_stream console command)
+#
+# Packet, little endian (see software/hardmuca.c) :
+#   magic 0xa5 0x5a, sequence (u16), timestamp (u32, sys_clk cycles), lines (u8), columns (u8),
+#   lines*columns samples (u16), CRC-16/CCITT (u16, poly 0x1021, init 0xffff, after the magic)
+#
+# Example :
+#   ./hmc_receiver.py /dev/ttyUSB1 --frames 100 --npy frames.npy
+#
+# The receiver works on any file-like byte stream (serial port, pty, socket.makefile("rb")).
+
+import argparse
+import struct
+import sys
+
+import numpy as np
+
+MAGIC = b"\xa5\x5a"
+HEADER = struct.Struct("<HIBB")
+
+
+def crc16(data, crc=0xffff):
+    for c in data:
+        crc ^= c << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else crc << 1
+            crc &= 0xffff
+    return crc
+
+
+# Packet of a frame, samples : (columns, lines) array, as the firmware sends it
+def encode_frame(seq, timestamp, samples):
+    samples = np.minimum(np.asarray(samples), 0xffff)
+    cols, lines = samples.shape
+    body = HEADER.pack(seq & 0xffff, timestamp & 0xffffffff, lines, cols) + samples.astype("<u2").tobytes()
+    return MAGIC + body + struct.pack("<H", crc16(body))
+
+
+class FrameReceiver:
+    def __init__(self, stream):
+        self.stream = stream
+        self.frames = 0         # Good frames received
+        self.dropped = 0        # Frames missing in the sequence numbers
+        self.crc_errors = 0     # Packets rejected (bad CRC)
+        self.skipped = 0        # Bytes skipped to find a magic (console text, partial packets)
+        self.last_seq = None
+
+    def _read(self, n):
+        data = b""
+        while len(data) < n:
+            chunk = self.stream.read(n - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    # Next good frame : (sequence, timestamp, samples as a (columns, lines) uint16 array)
+    # Raises EOFError at the end of the stream
+    def read_frame(self):
+        while True:
+            # Resynchronise on the magic
+            prev = self._read(1)
+            while True:
+                c = self._read(1)
+                if prev + c == MAGIC:
+                    break
+                self.skipped += 1
+                prev = c
+            header = self._read(HEADER.size)
+            seq, timestamp, lines, cols = HEADER.unpack(header)
+            data = self._read(2*lines*cols)
+            crc, = struct.unpack("<H", self._read(2))
+            if crc != crc16(header + data):
+                self.crc_errors += 1
+                continue
+            if self.last_seq is not None:
+                self.dropped += (seq - self.last_seq - 1) & 0xffff
+            self.last_seq = seq
+            self.frames += 1
+            samples = np.frombuffer(data, dtype="<u2").reshape(cols, lines)
+            return seq, timestamp, samples
+
+    # Up to count frames stacked : (sequences, timestamps, samples (frames, columns, lines))
+    def read_frames(self, count):
+        seqs, timestamps, frames = [], [], []
+        try:
+            for _ in range(count):
+                seq, timestamp, samples = self.read_frame()
+                seqs.append(seq)
+                timestamps.append(timestamp)
+                frames.append(samples)
+        except EOFError:
+            pass
+        return np.array(seqs, dtype=np.uint16), np.array(timestamps, dtype=np.uint32), np.array(frames)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Receive CapTouch frames streamed by the firmware")
+    parser.add_argument("port",                                 help="Serial port")
+    parser.add_argument("--baudrate", default=115200, type=int, help="Serial baudrate")
+    parser.add_argument("--frames",   default=100, type=int,    help="Frames to receive")
+    parser.add_argument("--clk",      default=12e6, type=float, help="sys_clk frequency (timestamps)")
+    parser.add_argument("--npy",      default=None,             help="Save the frames to this .npy file")
+    args = parser.parse_args()
+
+    import serial
+    port = serial.Serial(args.port, args.baudrate, timeout=2)
+    port.write("hmc_stream {}\n".format(args.frames).encode())
+    receiver = FrameReceiver(port)
+    seqs, timestamps, frames = receiver.read_frames(args.frames)
+    port.write(b"\n")   # Stops the stream if frames are missing
+    port.close()
+
+    if len(frames) > 1:
+        elapsed = ((int(timestamps[-1]) - int(timestamps[0])) & 0xffffffff)/args.clk
+        if elapsed:
+            print("{:.1f} frames/s".format((len(frames) - 1)/elapsed))
+    print("{} frames, {} dropped, {} CRC errors, {} bytes skipped".format(
+        receiver.frames, receiver.dropped, receiver.crc_errors, receiver.skipped))
+    if args.npy:
+        np.save(args.npy, frames)
+    return 0 if receiver.frames == args.frames else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
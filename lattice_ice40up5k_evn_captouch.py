@@ -17,6 +17,8 @@ from litex.gen import *
 from litex_boards.platforms import lattice_ice40up5k_evn
 from litex.build.lattice.programmer import IceStormProgrammer
 
+from flash_image import flash_image
+
 from litex.soc.cores.ram import Up5kSPRAM
 from litex.soc.cores.clock import iCE40PLL
 from litex.soc.integration.soc_core import *
@@ -29,7 +31,7 @@ from litex.build.generic_platform import *
 # CRG ----------------------------------------------------------------------------------------------
 
 class _CRG(LiteXModule):
-    def __init__(self, platform, sys_clk_freq):
+    def __init__(self, platform, sys_clk_freq, captouch_clk_freq=None):
         assert sys_clk_freq == 12e6
         self.rst    = Signal()
         self.cd_sys = ClockDomain()
@@ -52,17 +54,30 @@ class _CRG(LiteXModule):
         self.comb += self.cd_sys.clk.eq(sys)
         self.specials += AsyncResetSynchronizer(self.cd_sys, ~por_done)
 
+        # CapTouch capture Clk (finer resolution than sys)
+        if captouch_clk_freq is not None:
+            self.cd_captouch = ClockDomain()
+            self.pll = pll = iCE40PLL()
+            pll.register_clkin(sys, 12e6)
+            pll.create_clkout(self.cd_captouch, captouch_clk_freq, with_reset=False)
+            self.specials += AsyncResetSynchronizer(self.cd_captouch, ~por_done | ~pll.locked)
+            platform.add_period_constraint(self.cd_captouch.clk, 1e9/captouch_clk_freq)
+
 
 # BaseSoC ------------------------------------------------------------------------------------------
 
 class BaseSoC(SoCCore):
     def __init__(self, bios_flash_offset, sys_clk_freq=12e6,
-        with_led_chaser = True,
+        with_led_chaser   = True,
+        with_captouch_dma  = False,
+        with_captouch_perf = False,
+        with_captouch_filter = False,
+        captouch_clk_freq  = None,
         **kwargs):
         platform = lattice_ice40up5k_evn.Platform()
 
         # CRG --------------------------------------------------------------------------------------
-        self.crg = _CRG(platform, sys_clk_freq)
+        self.crg = _CRG(platform, sys_clk_freq, captouch_clk_freq)
 
         # SoCCore ----------------------------------------------------------------------------------
         # Disable Integrated ROM/SRAM since too large for iCE40 and UP5K has specific SPRAM.
@@ -145,7 +160,13 @@ class BaseSoC(SoCCore):
         # Module Instanciation
         from mutcaptouch import CapTouch
         n=m=4
-        self.submodules.captouch = CapTouch(n,m)
+        captouch_cd = "sys" if captouch_clk_freq is None else "captouch"
+        self.submodules.captouch = CapTouch(n,m, with_dma=with_captouch_dma, with_perf=with_captouch_perf,
+            with_filter=with_captouch_filter, clock_domain=captouch_cd)
+        self.add_constant("CAPTOUCH_FRAME_WORDS", self.captouch.frame_words)
+        self.add_constant("CAPTOUCH_NUM_LINES", n)
+        if with_captouch_dma:
+            self.bus.add_master(name="captouch_dma", master=self.captouch.dma.bus)
 
         # Tristate pins (cannot be simulated)
         _l = [] # TSTriple()
@@ -155,7 +176,7 @@ class BaseSoC(SoCCore):
             self.specials += _l[index].get_tristate(pad)
             self.comb += _l[index].oe.eq(self.captouch.lines_oe[index])
             self.comb += _l[index].o.eq(self.captouch.lines_o[index])
-            self.specials += MultiReg(_l[index].i, self.captouch.lines_i[index])
+            self.specials += MultiReg(_l[index].i, self.captouch.lines_i[index], captouch_cd)
         _c = [] # TSTriple()
         for index in range(m):
             _c.append(TSTriple())
@@ -163,7 +184,7 @@ class BaseSoC(SoCCore):
             self.specials += _c[index].get_tristate(pad)
             self.comb += _c[index].oe.eq(self.captouch.cols_oe[index])
             self.comb += _c[index].o.eq(self.captouch.cols_o[index])
-            self.specials += MultiReg(_c[index].i, self.captouch.cols_i[index])
+            self.specials += MultiReg(_c[index].i, self.captouch.cols_i[index], captouch_cd)
 
         if not ( (self.cpu_type == "serv") | (self.cpu_type == None)):    # Add IRQs
             self.irq.add("captouch", use_loc_if_exists=True)
@@ -172,32 +193,15 @@ class BaseSoC(SoCCore):
 
 # Flash --------------------------------------------------------------------------------------------
 
-def flash(bios_flash_offset, target="lattice_ice40up5k_evn"):
-    from litex.build.dfu import DFUProg
+def flash(bios_flash_offset, target="lattice_ice40up5k_evn", full=False):
     prog = IceStormProgrammer()
-    bitstream  = open("build/"+target+"/gateware/"+target+".bin",  "rb")
-    #bios       = open("build/"+target+"/software/bios/bios.bin", "rb")
-    bios       = open("app.bin", "rb")
-    image      = open("build/"+target+"/image.bin", "wb")
-    # Copy bitstream at 0x00000000
-    for i in range(0x00000000, 0x00020000):
-        b = bitstream.read(1)
-        if not b:
-            image.write(0xff.to_bytes(1, "big"))
-        else:
-            image.write(b)
-    # Copy bios at 0x00020000
-    for i in range(0x00000000, 0x00010000):
-        b = bios.read(1)
-        if not b:
-            image.write(0xff.to_bytes(1, "big"))
-        else:
-            image.write(b)
-    bitstream.close()
-    bios.close()
-    image.close()
-    print("Flashing bitstream (+bios)")
-    prog.flash(0x0, "build/"+target+"/image.bin")
+    bios_flash_offset = int(bios_flash_offset, 0) if isinstance(bios_flash_offset, str) else bios_flash_offset
+    # Bitstream at 0x00000000, app at bios_flash_offset (64KB)
+    regions = [
+        (0x00000000,        bios_flash_offset, "build/"+target+"/gateware/"+target+".bin"),
+        (bios_flash_offset, 0x00010000,        "app.bin"),
+    ]
+    flash_image(prog, regions, "build/"+target+"/image.bin", full=full)
 
 # Build --------------------------------------------------------------------------------------------
 
@@ -207,11 +211,20 @@ def main():
     parser.add_target_argument("--sys-clk-freq",      default=12e6, type=float, help="System clock frequency.")
     parser.add_target_argument("--bios-flash-offset", default="0x20000",        help="BIOS offset in SPI Flash.")
     parser.add_target_argument("--flash",             action="store_true",      help="Flash Bitstream.")
+    parser.add_target_argument("--flash-full",        action="store_true",      help="Flash the whole image, even the unchanged regions.")
+    parser.add_target_argument("--with-captouch-dma", action="store_true",      help="Write CapTouch frames into RAM (DMA).")
+    parser.add_target_argument("--with-captouch-perf", action="store_true",     help="CapTouch performance counters.")
+    parser.add_target_argument("--with-captouch-filter", action="store_true",   help="CapTouch spike rejection and IIR filter.")
+    parser.add_target_argument("--captouch-clk-freq", default=None, type=float, help="CapTouch capture clock frequency (PLL), sys clock if not set.")
     args = parser.parse_args()
 
     soc = BaseSoC(
         bios_flash_offset = int(args.bios_flash_offset, 0),
         sys_clk_freq      = args.sys_clk_freq,
+        with_captouch_dma  = args.with_captouch_dma,
+        with_captouch_perf = args.with_captouch_perf,
+        with_captouch_filter = args.with_captouch_filter,
+        captouch_clk_freq  = args.captouch_clk_freq,
         **parser.soc_argdict
     )
     builder = Builder(soc, **parser.builder_argdict)
@@ -219,7 +232,7 @@ def main():
         builder.build(**parser.toolchain_argdict)
 
     if args.flash:
-        flash(args.bios_flash_offset)
+        flash(args.bios_flash_offset, full=args.flash_full)
 
 if __name__ == "__main__":
     main()
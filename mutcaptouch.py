@@ -1,30 +1,925 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
+from functools import reduce
+from operator import add, and_, or_, xor
+
 from migen import *
 from migen.fhdl.specials import Tristate
 from migen.genlib.fifo import SyncFIFO
+from migen.genlib.cdc import MultiReg, PulseSynchronizer
 
 from litex.soc.interconnect.csr import *
 from litex.soc.interconnect.csr_eventmanager import *
 from litex.soc.interconnect import *
+from litex.soc.interconnect import wishbone
 from litex.soc.cores.gpio import GPIOOut, GPIOTristate
+from litex.soc.cores.dma import WishboneDMAWriter
+
+
+# Spike rejection and temporal filtering per sensor, first processing stage (with_filter=True)
+# The last three raw values and an IIR state (scaled by 2**shift) of each sensor are kept in block RAM:
+#   spike : the raw value (off), the median of the last 3, or the mean of the last 4 without their min and max
+#   state <- state - (state >> shift) + spike     (value = state >> shift, shift = 0 : no filtering)
+# The first frame after reset or after a ctrl write loads the history and the state with the raw values.
+class CapTouchFilter(Module, AutoCSR):
+    def __init__(self, frame_words, sw, max_shift=7):
+        self.sink = sink = stream.Endpoint([("data", sw)])      # Raw samples, in frame order
+        self.source = source = stream.Endpoint([("data", sw)])  # Filtered samples
+
+        ### CSR ###
+
+        self.ctrl = CSRStorage(fields=[
+            CSRField("spike", size=2, description="Spike rejection : 0 = off, 1 = median of the last 3 frames, 2 = mean of the last 4 frames without their min and max"),
+            CSRField("shift", size=bits_for(max_shift), description="IIR filter time constant, 2**shift frames (0 = off, max {})".format(max_shift)),
+        ])
+
+        ###
+
+        mem = Memory(3*sw + sw + max_shift, frame_words)
+        rd = mem.get_port()
+        wr = mem.get_port(write_capable=True)
+        self.specials += mem, rd, wr
+
+        index = Signal(max=max(frame_words, 2))    # Sensor of the incoming sample
+        loading = Signal(reset=1)   # (Re)loading the history and the states
+
+        # Stage 1 : history and state read
+        valid = Signal()
+        raw = Signal(sw)
+        last = Signal()
+        self.comb += rd.adr.eq(index)
+        self.sync += [
+            valid.eq(sink.valid),
+            raw.eq(sink.data),
+            last.eq(sink.last),
+            wr.adr.eq(index),
+            If(sink.valid,
+                If(sink.last,
+                    index.eq(0)
+                ).Else(
+                    index.eq(index + 1)
+                )
+            ),
+            If(self.ctrl.re,
+                loading.eq(1)
+            ).Elif(valid & last,
+                loading.eq(0)
+            ),
+        ]
+
+        # Stage 2 : spike rejection and IIR update
+        shift = self.ctrl.fields.shift
+        prev = [Signal(sw) for i in range(3)]   # Raw values of the previous frames, latest first
+        lo = Signal(sw)
+        hi = Signal(sw)
+        median = Signal(sw)
+        low = Signal(sw)
+        high = Signal(sw)
+        total = Signal(sw + 2)
+        trimmed = Signal(sw)
+        spike = Signal(sw)
+        state = Signal(sw + max_shift)
+        new_state = Signal(sw + max_shift)
+        self.comb += [
+            sink.ready.eq(1),
+            [If(loading,
+                prev[i].eq(raw)
+            ).Else(
+                prev[i].eq(rd.dat_r[i*sw:(i+1)*sw])
+            ) for i in range(3)],
+            If(loading,
+                state.eq(raw << shift)
+            ).Else(
+                state.eq(rd.dat_r[3*sw:])
+            ),
+            # Median of 3 : the third value clamped between the other two
+            lo.eq(Mux(raw < prev[0], raw, prev[0])),
+            hi.eq(Mux(raw < prev[0], prev[0], raw)),
+            median.eq(Mux(prev[1] < lo, lo, Mux(prev[1] > hi, hi, prev[1]))),
+            # Min/max of 4 rejected : half of the sum of the other two
+            low.eq(reduce(lambda a, b: Mux(a < b, a, b), [raw] + prev)),
+            high.eq(reduce(lambda a, b: Mux(a > b, a, b), [raw] + prev)),
+            total.eq(reduce(add, [raw] + prev)),
+            trimmed.eq((total - low - high) >> 1),
+            Case(self.ctrl.fields.spike, {
+                1: spike.eq(median),
+                2: spike.eq(trimmed),
+                "default": spike.eq(raw),
+            }),
+            new_state.eq(state - (state >> shift) + spike),
+            wr.we.eq(valid),
+            wr.dat_w.eq(Cat(raw, prev[0], prev[1], new_state)),
+            source.valid.eq(valid),
+            source.last.eq(last),
+            source.data.eq(new_state >> shift),
+        ]
+
+
+# Hadamard decoding, processing stage (hadamard=True) : a frame is steps sub-scans where column c is
+# driven high when H[k][c+1] = +1 and low otherwise (H : Sylvester Hadamard matrix of size steps, a power
+# of 2 above num_cols, H[k][j] = (-1)**popcount(k & j)). One value per line and column is recovered :
+#   value[c][line] = sum(H[k][c+1]*sample[k][line] for k in range(steps)) >> log2(steps)   (signed, sw + 1 bits)
+# Column 0 of H (all +1) is not driven : what is common to all the sub-scans cancels out.
+# The sub-scans are stored in block RAM, then each value is summed over steps cycles.
+class CapTouchHadamard(Module):
+    def __init__(self, num_lines, num_cols, steps, sw):
+        self.sink = sink = stream.Endpoint([("data", sw)])             # Sub-scans, in order
+        self.source = source = stream.Endpoint([("data", sw + 1)])     # Values, column by column
+        self.busy = Signal()    # Frame being decoded (no new frame can be received)
+
+        ###
+
+        mem = Memory(sw, steps*num_lines)
+        rd = mem.get_port()
+        wr = mem.get_port(write_capable=True)
+        self.specials += mem, rd, wr
+
+        index = Signal(max=steps*num_lines)     # Sample being written
+        col = Signal(max=max(num_cols, 2))
+        line = Signal(max=max(num_lines, 2))
+        k = Signal(max=steps + 1)               # Sub-scan being read, summed in the next cycle
+        acc = Signal((sw + log2_int(steps) + 1, True))
+
+        # Sign of the sub-scan read in the previous cycle : parity of (k - 1) & (col + 1)
+        prev = Signal(max=steps)
+        code = Signal(max=steps)
+        negative = Signal()
+        self.comb += [
+            prev.eq(k - 1),
+            code.eq(prev & (col + 1)),
+            negative.eq(reduce(xor, [code[i] for i in range(len(code))])),
+            rd.adr.eq(Mux(k == steps, 0, k)*num_lines + line),
+            wr.adr.eq(index),
+            wr.dat_w.eq(sink.data),
+        ]
+
+        self.submodules.fsm = fsm = FSM(reset_state="LOAD")
+        self.comb += self.busy.eq(~fsm.ongoing("LOAD"))
+        fsm.act("LOAD",
+            sink.ready.eq(1),
+            If(sink.valid,
+                wr.we.eq(1),
+                NextValue(index, index + 1),
+                If(sink.last,
+                    NextValue(index, 0),
+                    NextValue(k, 0),
+                    NextValue(acc, 0),
+                    NextValue(col, 0),
+                    NextValue(line, 0),
+                    NextState("SUM"),
+                )
+            )
+        )
+        fsm.act("SUM",
+            NextValue(k, k + 1),
+            If(k != 0,
+                If(negative,
+                    NextValue(acc, acc - rd.dat_r),
+                ).Else(
+                    NextValue(acc, acc + rd.dat_r),
+                )
+            ),
+            If(k == steps,
+                NextState("SEND"),
+            )
+        )
+        fsm.act("SEND",
+            source.valid.eq(1),
+            source.data.eq(acc >> log2_int(steps)),
+            source.last.eq((col == num_cols - 1) & (line == num_lines - 1)),
+            If(source.ready,
+                NextValue(k, 0),
+                NextValue(acc, 0),
+                NextValue(line, line + 1),
+                If(line == num_lines - 1,
+                    NextValue(line, 0),
+                    NextValue(col, col + 1),
+                ),
+                If(source.last,
+                    NextState("LOAD"),
+                ).Else(
+                    NextState("SUM"),
+                )
+            )
+        )
+
+
+# Baseline tracking and touch detection, between the capture FSM and the FIFO
+# One baseline per sensor is kept in block RAM as an IIR state scaled by 2**shift:
+#   state <- state - (state >> shift) + raw     (baseline = state >> shift)
+# The baseline is not updated while its sensor is touched, the first frame after reset
+# or after ctrl.calibrate loads it with the raw values.
+class CapTouchBaseline(Module, AutoCSR):
+    def __init__(self, frame_words, sw, shift=4):
+        self.sink = sink = stream.Endpoint([("data", sw)])      # Raw samples, in frame order
+        self.source = source = stream.Endpoint([("data", sw)])  # Raw samples or deltas
+        self.change = Signal()  # Pulse when the touched bitmap changes (end of frame)
+
+        ### CSR ###
+
+        self.ctrl = CSRStorage(fields=[
+            CSRField("calibrate", size=1, pulse=True, description="Load the baselines with the next frame"),
+            CSRField("delta", size=1, description="Output the difference to the baseline (two's complement, saturated to the sample width) instead of the raw value"),
+            CSRField("detect", size=1, description="Touch detection only : no sample is pushed into the FIFO, the interrupt fires when the touched bitmap changes"),
+        ])
+        self.threshold = CSRStorage(sw, reset=2**sw-1)  # Touched when |raw - baseline| >= threshold
+        self.touched = CSRStatus(frame_words)           # Touched bitmap of the last frame (bit = sensor index)
+
+        ###
+
+        mem = Memory(sw + shift, frame_words)
+        rd = mem.get_port()
+        wr = mem.get_port(write_capable=True)
+        self.specials += mem, rd, wr
+
+        index = Signal(max=max(frame_words, 2))    # Sensor of the incoming sample
+        loading = Signal(reset=1)   # (Re)loading the baselines
+
+        # Stage 1 : baseline read
+        valid = Signal()
+        raw = Signal(sw)
+        last = Signal()
+        self.comb += rd.adr.eq(index)
+        self.sync += [
+            valid.eq(sink.valid),
+            raw.eq(sink.data),
+            last.eq(sink.last),
+            wr.adr.eq(index),
+            If(sink.valid,
+                If(sink.last,
+                    index.eq(0)
+                ).Else(
+                    index.eq(index + 1)
+                )
+            ),
+            If(self.ctrl.fields.calibrate,
+                loading.eq(1)
+            ).Elif(valid & last,
+                loading.eq(0)
+            ),
+        ]
+
+        # Stage 2 : delta, threshold and baseline update
+        baseline = Signal(sw)
+        delta = Signal((sw + 1, True))
+        delta_sat = Signal((sw, True))  # Delta saturated to the signed sw bits range of the source
+        magnitude = Signal(sw + 1)
+        touch = Signal()
+        bitmap = Signal(frame_words)
+        self.comb += [
+            sink.ready.eq(1),
+            baseline.eq(rd.dat_r >> shift),
+            If(~loading,
+                delta.eq(raw - baseline)
+            ),
+            magnitude.eq(Mux(delta < 0, -delta, delta)),
+            If(delta > 2**(sw-1) - 1,
+                delta_sat.eq(2**(sw-1) - 1)
+            ).Elif(delta < -2**(sw-1),
+                delta_sat.eq(-2**(sw-1))
+            ).Else(
+                delta_sat.eq(delta)
+            ),
+            touch.eq(~loading & (magnitude >= self.threshold.storage)),
+            wr.we.eq(valid & ~touch),
+            If(loading,
+                wr.dat_w.eq(raw << shift)
+            ).Else(
+                wr.dat_w.eq(rd.dat_r - baseline + raw)
+            ),
+            source.valid.eq(valid & ~self.ctrl.fields.detect),
+            source.last.eq(last),
+            If(self.ctrl.fields.delta,
+                source.data.eq(delta_sat)
+            ).Else(
+                source.data.eq(raw)
+            ),
+        ]
+        # Samples arrive in order : shift the touch bits in, sensor 0 ends up in bit 0
+        self.sync += [
+            self.change.eq(0),
+            If(valid,
+                bitmap.eq(Cat(bitmap[1:], touch)),
+                If(last,
+                    self.touched.status.eq(Cat(bitmap[1:], touch)),
+                    self.change.eq(Cat(bitmap[1:], touch) != self.touched.status),
+                )
+            )
+        ]
+
+
+# Touch point extraction, between the baseline and the FIFO : a frame goes out as a short touch list
+# The frame is stored in block RAM, then each sensor is compared with its 8 neighbours (read one by one,
+# 0 outside of the panel). A local maximum (strictly above the neighbours before it in frame order,
+# at least equal to the ones after it) with a peak >= threshold is a touch, interpolated with the
+# weighted centroid of its 3x3 neighbourhood. Up to max_touches are kept (the weakest one is
+# replaced by a stronger touch), the list goes out as :
+#   n, then x, y, peak of each touch (n words + 1, last set on the last one)
+# x (line) and y (column, 0 when not in matrix mode) are fixed point, frac fractional bits.
+# Signed samples (baseline deltas) below 0 count as 0. Frames go through unchanged when ctrl.enable is 0.
+class CapTouchTouches(Module, AutoCSR):
+    def __init__(self, num_lines, steps, sw, max_touches=4, frac=4):
+        frame_words = num_lines*steps
+        cw = bits_for((max(num_lines, steps) - 1) << frac)     # Width of the coordinates
+        assert cw <= sw, "coordinates do not fit in the samples, reduce frac"
+        self.words = 1 + 3*max_touches  # Longest list
+        self.sink = sink = stream.Endpoint([("data", sw)])
+        self.source = source = stream.Endpoint([("data", sw)])
+        self.signed = Signal()
+        self.busy = Signal()    # Frame being processed (no new frame can be received)
+
+        ### CSR ###
+
+        self.ctrl = CSRStorage(fields=[
+            CSRField("enable", size=1, description="Output the touch list instead of the frame (change it between frames)"),
+        ])
+        self.threshold = CSRStorage(sw, reset=2**sw-1)  # Touch when the peak >= threshold
+
+        ###
+
+        mem = Memory(sw, frame_words)
+        rd = mem.get_port()
+        wr = mem.get_port(write_capable=True)
+        self.specials += mem, rd, wr
+
+        # Sensor being processed
+        cell = Signal(max=max(frame_words, 2))
+        x = Signal(max=max(num_lines, 2))
+        y = Signal(max=max(steps, 2))
+
+        # Neighbourhood, nb[4] is the sensor (nb[3*(dy+1) + dx+1])
+        nb = [Signal(sw) for i in range(9)]
+        k = Signal(max=10)      # Neighbour being read
+        inside = Signal()
+        inside_d = Signal()
+
+        # Touch list
+        count = Signal(max=max_touches + 1)
+        tx = [Signal(cw) for i in range(max_touches)]
+        ty = [Signal(cw) for i in range(max_touches)]
+        tp = [Signal(sw) for i in range(max_touches)]
+        slot = Signal(max=max(max_touches, 2))
+        word = Signal(max=self.words)
+
+        # Weakest touch of the list (first one on ties)
+        weak = Signal(max=max(max_touches, 2))
+        weak_peak = Signal(sw)
+        chain = [(0, tp[0])]
+        for i in range(1, max_touches):
+            index, peak = Signal(max=max(max_touches, 2)), Signal(sw)
+            prev_index, prev_peak = chain[-1]
+            self.comb += If(tp[i] < prev_peak,
+                    index.eq(i), peak.eq(tp[i]),
+                ).Else(
+                    index.eq(prev_index), peak.eq(prev_peak),
+                )
+            chain.append((index, peak))
+        self.comb += [weak.eq(chain[-1][0]), weak_peak.eq(chain[-1][1])]
+
+        # Local maximum and centroid sums of the neighbourhood
+        peak = nb[4]
+        is_touch = Signal()
+        total = Signal(sw + 4)
+        sx = Signal((sw + 3, True))
+        sy = Signal((sw + 3, True))
+        self.comb += [
+            is_touch.eq((peak != 0) & (peak >= self.threshold.storage) &
+                reduce(and_, [peak > nb[i] for i in range(4)] + [peak >= nb[i] for i in range(5, 9)]) &
+                ((count != max_touches) | (peak > weak_peak))),
+            total.eq(reduce(add, nb)),
+            sx.eq(nb[2] + nb[5] + nb[8] - nb[0] - nb[3] - nb[6]),
+            sy.eq(nb[6] + nb[7] + nb[8] - nb[0] - nb[1] - nb[2]),
+        ]
+
+        # Sub-cell offsets : |s|*2**frac/total (<= 2**frac), one quotient bit per cycle
+        den = Signal(sw + 4)
+        rx = Signal(sw + 5)
+        ry = Signal(sw + 5)
+        qx = Signal(frac + 1)
+        qy = Signal(frac + 1)
+        neg_x = Signal()
+        neg_y = Signal()
+        bit = Signal(max=frac + 2)
+
+        # Negative samples are stored as 0
+        value = Signal(sw)
+        self.comb += [
+            If(self.signed & sink.data[-1],
+                value.eq(0)
+            ).Else(
+                value.eq(sink.data)
+            ),
+            wr.adr.eq(cell),
+            wr.dat_w.eq(value),
+        ]
+
+        self.submodules.fsm = fsm = FSM(reset_state="LOAD")
+        self.comb += self.busy.eq(~fsm.ongoing("LOAD"))
+        fsm.act("LOAD",
+            If(self.ctrl.fields.enable,
+                sink.ready.eq(1),
+                If(sink.valid,
+                    wr.we.eq(1),
+                    NextValue(cell, cell + 1),
+                    If(sink.last,
+                        NextValue(cell, 0),
+                        NextValue(x, 0),
+                        NextValue(y, 0),
+                        NextValue(k, 0),
+                        NextValue(count, 0),
+                        NextState("READ"),
+                    )
+                )
+            ).Else(
+                sink.connect(source),
+            )
+        )
+        # Neighbour k read in this cycle, stored in the next one
+        neighbours = {}
+        for i in range(9):
+            dx, dy = i % 3 - 1, i//3 - 1
+            cond = []
+            if dx < 0:
+                cond.append(x != 0)
+            if dx > 0:
+                cond.append(x != num_lines - 1)
+            if dy < 0:
+                cond.append(y != 0)
+            if dy > 0:
+                cond.append(y != steps - 1)
+            neighbours[i] = [
+                rd.adr.eq(cell + dy*num_lines + dx),
+                inside.eq(reduce(and_, cond) if cond else 1),
+            ]
+        fsm.act("READ",
+            Case(k, neighbours),
+            NextValue(inside_d, inside),
+            NextValue(k, k + 1),
+            Case(k, {i + 1: NextValue(nb[i], Mux(inside_d, rd.dat_r, 0)) for i in range(9)}),
+            If(k == 9,
+                NextValue(k, 0),
+                NextState("CHECK"),
+            )
+        )
+        fsm.act("CHECK",
+            If(is_touch,
+                NextValue(den, total),
+                NextValue(rx, Mux(sx < 0, -sx, sx)),
+                NextValue(ry, Mux(sy < 0, -sy, sy)),
+                NextValue(neg_x, sx < 0),
+                NextValue(neg_y, sy < 0),
+                NextValue(bit, 0),
+                NextState("DIVIDE"),
+            ).Else(
+                NextState("NEXT"),
+            ),
+            NextValue(slot, Mux(count == max_touches, weak, count)),
+        )
+        fsm.act("DIVIDE",
+            NextValue(qx, Cat(rx >= den, qx)),
+            NextValue(qy, Cat(ry >= den, qy)),
+            NextValue(rx, Mux(rx >= den, rx - den, rx) << 1),
+            NextValue(ry, Mux(ry >= den, ry - den, ry) << 1),
+            NextValue(bit, bit + 1),
+            If(bit == frac,
+                NextState("STORE"),
+            )
+        )
+        fsm.act("STORE",
+            Case(slot, {i: [
+                NextValue(tx[i], Mux(neg_x, (x << frac) - qx, (x << frac) + qx)),
+                NextValue(ty[i], Mux(neg_y, (y << frac) - qy, (y << frac) + qy)),
+                NextValue(tp[i], peak),
+            ] for i in range(max_touches)}),
+            If(count != max_touches,
+                NextValue(count, count + 1),
+            ),
+            NextState("NEXT"),
+        )
+        fsm.act("NEXT",
+            NextValue(cell, cell + 1),
+            If(x == num_lines - 1,
+                NextValue(x, 0),
+                NextValue(y, y + 1),
+            ).Else(
+                NextValue(x, x + 1),
+            ),
+            If(cell == frame_words - 1,
+                NextValue(cell, 0),
+                NextValue(word, 0),
+                NextState("SEND"),
+            ).Else(
+                NextState("READ"),
+            )
+        )
+        words = Array([count] + [t[i] for i in range(max_touches) for t in (tx, ty, tp)])
+        fsm.act("SEND",
+            source.valid.eq(1),
+            source.data.eq(words[word]),
+            source.last.eq(word == 3*count),
+            If(source.ready,
+                NextValue(word, word + 1),
+                If(source.last,
+                    NextState("LOAD"),
+                )
+            )
+        )
+
+
+# DMA : writes the frames into a ring buffer in main RAM (one 32-bit word per FIFO word)
+# Frame slot i of the ring is at base + 4*i*slot, index is the next slot to be written. Frames can be shorter
+# than a slot (packing, region of interest, touch lists) : slot is the longest frame by default, a frame
+# starts at the beginning of its slot whatever the length of the previous one.
+class CapTouchDMA(Module, AutoCSR):
+    def __init__(self, sw, slot_words):
+        self.bus = wishbone.Interface(data_width=32, adr_width=30)
+        self.sink = sink = stream.Endpoint([("data", sw)])  # Samples, last set on the last sample of a frame
+        self.frame_done = Signal()  # Pulse when a whole frame is in RAM
+
+        ### CSR ###
+
+        self.ctrl = CSRStorage(fields=[
+            CSRField("enable", size=1, description="Frames go to RAM instead of ``capdata`` (ring restarts at slot 0)"),
+        ])
+        self.base = CSRStorage(32)              # Ring buffer address (bytes, 32-bit aligned)
+        self.frames = CSRStorage(16, reset=1)   # Ring buffer size (frames)
+        self.slot = CSRStorage(16, reset=slot_words)    # Frame slot size (words), at least the longest frame
+        self.index = CSRStatus(16)              # Next frame slot to be written
+
+        ###
+
+        # Samples are 32-bit words for the CPU, not byte streams : no byte swapping
+        self.submodules.writer = writer = WishboneDMAWriter(self.bus, endianness="big")
+
+        slot = Signal(30)      # Word offset of the frame slot in the ring
+        offset = Signal(16)    # Word offset in the frame
+        self.comb += [
+            writer.sink.valid.eq(sink.valid),
+            writer.sink.address.eq(self.base.storage[2:] + slot + offset),
+            writer.sink.data.eq(sink.data),
+            sink.ready.eq(writer.sink.ready),
+        ]
+        self.sync += [
+            self.frame_done.eq(0),
+            If(~self.ctrl.fields.enable,
+                slot.eq(0),
+                offset.eq(0),
+                self.index.status.eq(0),
+            ).Elif(sink.valid & sink.ready,
+                offset.eq(offset + 1),
+                If(sink.last,
+                    self.frame_done.eq(1),
+                    offset.eq(0),
+                    slot.eq(slot + self.slot.storage),
+                    self.index.status.eq(self.index.status + 1),
+                    If(self.index.status == self.frames.storage - 1,
+                        slot.eq(0),
+                        self.index.status.eq(0),
+                    )
+                )
+            )
+        ]
+
+
+# Packing of the samples into 32-bit words, between the processing stages and the FIFO
+# mode 0 : one sample per word, mode 1 : two 16-bit samples, mode 2 : four 8-bit samples.
+# The first sample is in the low bits, samples are saturated (signed when signed is set, e.g. deltas)
+# and a frame always starts with a new word (the last word of a frame may not be full).
+class CapTouchPacker(Module):
+    def __init__(self, sw):
+        self.sink = sink = stream.Endpoint([("data", sw)])
+        self.source = source = stream.Endpoint([("data", 32)])
+        self.mode = Signal(2)
+        self.signed = Signal()
+
+        ###
+
+        def saturate(bits):
+            value = Signal(bits)
+            data = Signal((sw, True))
+            self.comb += data.eq(sink.data)
+            if sw <= bits:
+                # Fits : sign extended when signed
+                self.comb += If(self.signed,
+                    value.eq(data)
+                ).Else(
+                    value.eq(sink.data)
+                )
+                return value
+            self.comb += [
+                If(self.signed,
+                    If(data > 2**(bits-1)-1,
+                        value.eq(2**(bits-1)-1)
+                    ).Elif(data < -2**(bits-1),
+                        value.eq(2**(bits-1))
+                    ).Else(
+                        value.eq(data)
+                    )
+                ).Elif(sink.data > 2**bits-1,
+                    value.eq(2**bits-1)
+                ).Else(
+                    value.eq(sink.data)
+                )
+            ]
+            return value
+        v16 = saturate(16)
+        v8 = saturate(8)
+
+        word = Signal(32)       # Word being filled
+        count = Signal(2)       # Samples already in word
+        next_word = Signal(32)
+        full = Signal()
+        self.comb += [
+            sink.ready.eq(1),
+            next_word.eq(word),
+            Case(self.mode, {
+                1: [
+                    Case(count[0], {i: next_word[16*i:16*(i+1)].eq(v16) for i in range(2)}),
+                    full.eq(count[0] == 1),
+                ],
+                2: [
+                    Case(count, {i: next_word[8*i:8*(i+1)].eq(v8) for i in range(4)}),
+                    full.eq(count == 3),
+                ],
+                "default": [
+                    next_word.eq(sink.data),
+                    full.eq(1),
+                ],
+            }),
+        ]
+        self.sync += [
+            source.valid.eq(0),
+            If(sink.valid,
+                If(full | sink.last,
+                    source.valid.eq(1),
+                    source.data.eq(next_word),
+                    source.last.eq(sink.last),
+                    word.eq(0),
+                    count.eq(0),
+                ).Else(
+                    word.eq(next_word),
+                    count.eq(count + 1),
+                )
+            )
+        ]
+
+
+# Frame header and trailer, after the processing stages (32-bit words)
+# A frame goes out as :
+#   timestamp (sys cycle counter at the start of the frame), sequence (frames started or dropped since
+#   reset : a gap means frames were lost), the words of the frame, then the scan duration (cycles from
+#   the start of the frame to the end of its last capture, only known once the frame is over).
+# The stages do not wait : the words are buffered while the header goes out. The values of the frames
+# in flight are queued (start : timestamp/sequence, end : duration), empty frames are dropped.
+class CapTouchFramer(Module):
+    def __init__(self, dw):
+        self.sink = sink = stream.Endpoint([("data", dw)])
+        self.source = source = stream.Endpoint([("data", 32)])
+        self.start = Signal()
+        self.timestamp = Signal(32)
+        self.sequence = Signal(32)
+        self.end = Signal()
+        self.duration = Signal(32)
+        self.empty = Signal()   # The frame ending had no words (pre-scan without a touch)
+
+        ###
+
+        self.submodules.buffer = buffer = stream.SyncFIFO([("data", dw)], 4, buffered=False)
+        self.submodules.starts = starts = stream.SyncFIFO([("timestamp", 32), ("sequence", 32)], 4, buffered=False)
+        self.submodules.ends = ends = stream.SyncFIFO([("duration", 32), ("empty", 1)], 4, buffered=False)
+        self.level = buffer.level   # Words held
+        self.comb += [
+            sink.connect(buffer.sink),
+            starts.sink.valid.eq(self.start),
+            starts.sink.timestamp.eq(self.timestamp),
+            starts.sink.sequence.eq(self.sequence),
+            ends.sink.valid.eq(self.end),
+            ends.sink.duration.eq(self.duration),
+            ends.sink.empty.eq(self.empty),
+        ]
+
+        self.submodules.fsm = fsm = FSM(reset_state="TIMESTAMP")
+        fsm.act("TIMESTAMP",
+            If(ends.source.valid & ends.source.empty,
+                starts.source.ready.eq(1),
+                ends.source.ready.eq(1),
+            ).Else(
+                source.valid.eq(buffer.source.valid & starts.source.valid),
+            ),
+            source.data.eq(starts.source.timestamp),
+            If(source.valid & source.ready,
+                NextState("SEQUENCE"),
+            )
+        )
+        fsm.act("SEQUENCE",
+            source.valid.eq(1),
+            source.data.eq(starts.source.sequence),
+            If(source.ready,
+                starts.source.ready.eq(1),
+                NextState("DATA"),
+            )
+        )
+        fsm.act("DATA",
+            source.valid.eq(buffer.source.valid),
+            source.data.eq(buffer.source.data),
+            buffer.source.ready.eq(source.ready),
+            If(buffer.source.valid & source.ready & buffer.source.last,
+                NextState("DURATION"),
+            )
+        )
+        fsm.act("DURATION",
+            source.valid.eq(ends.source.valid),
+            source.data.eq(ends.source.duration),
+            source.last.eq(1),
+            If(source.valid & source.ready,
+                ends.source.ready.eq(1),
+                NextState("TIMESTAMP"),
+            )
+        )
+
+
+# Performance counters : cycles in RUN per frame, timeouts per line, FIFO high-water mark, frames
+# dropped and completed. They count from reset or the last ctrl.clear, ctrl.snapshot copies them all
+# at once into the CSRs. The capture counters are in its clock domain : read them once the snapshot
+# has gone through (a few cycles).
+class CapTouchPerf(Module, AutoCSR):
+    def __init__(self, num_lines, level_bits, clock_domain="sys"):
+        # Capture domain
+        self.run = Signal()                 # In RUN
+        self.timeouts = Signal(num_lines)   # Lines timing out
+        self.capture_end = Signal()         # Last capture of the frame over
+        # sys
+        self.level = Signal(level_bits)     # FIFO level
+        self.dropped = Signal()             # Frame dropped (auto mode)
+        self.frame = Signal()               # Frame completed
+
+        ### CSR ###
+
+        self.ctrl = CSRStorage(fields=[
+            CSRField("snapshot", size=1, pulse=True, description="Copy the counters into the CSRs"),
+            CSRField("clear", size=1, pulse=True, description="Clear the counters"),
+        ])
+        self.run_cycles = CSRStatus(32)         # Cycles in RUN of the last frame (capture cycles)
+        self.run_cycles_max = CSRStatus(32)     # Of the slowest frame
+        self.frames = CSRStatus(32)             # Frames completed (into the FIFO, or RAM with the DMA)
+        self.dropped_frames = CSRStatus(32)
+        self.fifo_max = CSRStatus(level_bits)   # FIFO high-water mark
+        for a in range(num_lines):
+            name = "timeouts{}".format(a)
+            setattr(self, name, CSRStatus(16, name=name))   # Captures where line a timed out
+        timeouts_csrs = [getattr(self, "timeouts{}".format(a)) for a in range(num_lines)]
+
+        ###
+
+        snapshot = Signal()
+        clear = Signal()
+        if clock_domain != "sys":
+            self.submodules.snapshot_sync = PulseSynchronizer("sys", clock_domain)
+            self.submodules.clear_sync = PulseSynchronizer("sys", clock_domain)
+            self.comb += [
+                self.snapshot_sync.i.eq(self.ctrl.fields.snapshot),
+                self.clear_sync.i.eq(self.ctrl.fields.clear),
+                snapshot.eq(self.snapshot_sync.o),
+                clear.eq(self.clear_sync.o),
+            ]
+        else:
+            self.comb += [
+                snapshot.eq(self.ctrl.fields.snapshot),
+                clear.eq(self.ctrl.fields.clear),
+            ]
+        csync = getattr(self.sync, clock_domain)
+
+        # Capture domain
+        run_count = Signal(32)      # Current frame
+        run_last = Signal(32)
+        run_max = Signal(32)
+        timeouts = [Signal(16) for a in range(num_lines)]
+        csync += [
+            If(self.capture_end | clear,
+                run_count.eq(0),
+            ).Elif(self.run & (run_count != 2**32-1),
+                run_count.eq(run_count + 1),
+            ),
+            If(clear,
+                run_last.eq(0),
+                run_max.eq(0),
+            ).Elif(self.capture_end,
+                run_last.eq(run_count),
+                If(run_count > run_max,
+                    run_max.eq(run_count),
+                )
+            ),
+            If(snapshot,
+                self.run_cycles.status.eq(run_last),
+                self.run_cycles_max.status.eq(run_max),
+            ),
+        ]
+        for a in range(num_lines):
+            csync += [
+                If(clear,
+                    timeouts[a].eq(0),
+                ).Elif(self.timeouts[a] & (timeouts[a] != 2**16-1),
+                    timeouts[a].eq(timeouts[a] + 1),
+                ),
+                If(snapshot,
+                    timeouts_csrs[a].status.eq(timeouts[a]),
+                ),
+            ]
+
+        # sys
+        frames = Signal(32)
+        dropped = Signal(32)
+        fifo_max = Signal(level_bits)
+        self.sync += [
+            If(self.ctrl.fields.clear,
+                frames.eq(0),
+                dropped.eq(0),
+                fifo_max.eq(0),
+            ).Else(
+                If(self.frame,
+                    frames.eq(frames + 1),
+                ),
+                If(self.dropped,
+                    dropped.eq(dropped + 1),
+                ),
+                If(self.level > fifo_max,
+                    fifo_max.eq(self.level),
+                ),
+            ),
+            If(self.ctrl.fields.snapshot,
+                self.frames.status.eq(frames),
+                self.dropped_frames.status.eq(dropped),
+                self.fifo_max.status.eq(fifo_max),
+            ),
+        ]
 
 
 class CapTouch(Module, AutoCSR):
-    def __init__(self, num_lines, num_cols):
-        dw=32   # To be adjusted to the max time a capture can last
-        timeout=12**6   # Timeout (number of cycles to wait max, dependent on freq)
-        #timeout=42   # Timeout (number of cycles to wait max, dependent on freq)
-        fifo_depth=num_lines
-        #fifo_depth=num_lines*num_cols
-        #self.source = stream.Endpoint([("data", dw)])
-        self.loop_id = Signal(max=num_lines)  # Counter to iterate through the measures at the end of a capture
+    # matrix=False: all columns are driven at once, one value per line is captured (num_lines values per frame)
+    # matrix=True : columns are driven one at a time and every line is timed against each of them,
+    #               a frame is num_lines*num_cols values, column by column (index = col*num_lines + line)
+    # max_timeout : longest capture (in cycles) the timeout register can be set to, sizes the counters
+    #               (a line still low at timeout reads as the timeout value)
+    # max_oversampling : largest number of captures (power of 2) accumulated for each sample,
+    #               the "oversampling" register selects 2**n captures at runtime
+    # with_baseline : baseline tracking and touch detection stage (CapTouchBaseline) before the FIFO
+    # with_dma    : Wishbone master (CapTouchDMA, "dma.bus" to be added to the SoC) writing the frames into RAM
+    # fifo_frames : FIFO depth, in frames
+    # with_packing : 32-bit FIFO words holding one, two or four samples (CapTouchPacker, config.pack)
+    # timestamps  : no counter register per line, the first edges are timestamped into block RAM (scales to
+    #               16-32 lines on iCE40), the samples are read back after each capture (num_lines+1 cycles)
+    # clock_domain : domain of the capture (FSM, counter, edge detection), a faster clock than sys gives a finer
+    #               resolution (counts, timeout and discharge_cycles are in its cycles). The samples cross to sys
+    #               through an async FIFO, timeout/oversampling/mean are resynchronised (write them between frames).
+    #               lines_i (and cols_i, read by the pre-scan) must be resynchronised to this domain.
+    # with_source : frames out of the FIFO on "source" only (stream, e.g. CapTouchPanels), capdata is not used.
+    #               Otherwise "source" is still there, fed instead of capdata when config.stream is set (UART
+    #               streamer, Etherbone, a DMA writer... : frames go out without the CPU)
+    # with_touches : touch point extraction stage (CapTouchTouches, up to max_touches, touch_frac fractional bits),
+    #               a frame can go out as its touch list (touches.ctrl.enable)
+    # with_roi    : region of interest (roi register) : only the lines and columns of a window are captured and
+    #               sent (shorter frames, shorter scans in matrix mode), with a full scan every roi_period frames.
+    #               The processing stages need whole frames : not available with the baseline or touch stages.
+    # with_header : 32-bit FIFO words, each frame between a timestamp/sequence header and a duration
+    #               trailer (CapTouchFramer, 3 words more per frame)
+    # with_perf   : performance counters (CapTouchPerf, "perf" CSRs)
+    # with_prescan : self-capacitance pre-scan (prescan register) : all lines and columns are discharged then timed
+    #               together, the mutual scan only runs when one of them is still low after prescan_threshold
+    #               cycles (lines and columns need pull-ups). Frames without a touch send nothing.
+    # hadamard    : matrix mode, all the columns driven at once with orthogonal +1/-1 (high/low) patterns over
+    #               2**bits_for(num_cols) sub-scans, decoded back to one signed value per line and column
+    #               (CapTouchHadamard). Not available with the baseline stage or a region of interest.
+    # with_filter : spike rejection and IIR filter per sensor on the raw samples (CapTouchFilter, filter.ctrl),
+    #               before the other processing stages. Needs whole frames : not available with a region of interest.
+    def __init__(self, num_lines, num_cols, matrix=False, discharge_cycles=4, max_timeout=2**16-1, max_oversampling=1,
+        with_baseline=False, baseline_shift=4, with_dma=False, fifo_frames=1, with_packing=False, timestamps=False,
+        clock_domain="sys", with_source=False, with_touches=False, max_touches=4, touch_frac=4, with_roi=False,
+        with_header=False, with_perf=False, with_prescan=False, hadamard=False, with_filter=False):
+        assert not (with_roi and (with_baseline or with_touches or with_filter))
+        assert not hadamard or (matrix and not (with_roi or with_baseline))
+        cdc = clock_domain != "sys"
+        dw=bits_for(max_timeout)    # Width of the counters
+        sw=dw + log2_int(max_oversampling)  # Width of the samples (sum of the oversampled captures)
+        self.frame_words = num_lines*num_cols if matrix else num_lines
+        # Scan steps of a frame : columns (matrix mode), or Hadamard sub-scans
+        steps = 2**bits_for(num_cols) if hadamard else num_cols if matrix else 1
+        # Longest frame out of the processing stages (a touch list can be longer than a small frame)
+        out_words = max(self.frame_words, 1 + 3*max_touches) if with_touches else self.frame_words
+        if with_header:
+            out_words += 3
+        fifo_depth=fifo_frames*out_words
+        self.loop_id = Signal(max=num_lines)  # Counter to iterate through the measures of a capture while serialising them
+        self.col_id = Signal(max=max(steps, 2))   # Column driven during the current scan step (matrix mode), or sub-scan
+        self.os_id = Signal(max=max(max_oversampling, 2))   # Capture being accumulated (oversampling)
         self.trig = Signal()    # Trigger the start of a capture
 
         # Counters
         counter = Signal(dw) # Time counter
-        buf = Array(Signal(dw) for a in range(num_lines))
+        if not timestamps:
+            buf = Array(Signal(sw) for a in range(num_lines))
+            shadow = Array(Signal(sw) for a in range(num_lines))    # Results of the previous capture, being serialised
+        seen = Signal(num_lines)    # Lines already up (or timed out) during the current capture
 
         # Lines
         #self.lines_pads = Signal(num_lines)
@@ -41,10 +936,41 @@ class CapTouch(Module, AutoCSR):
         self.cols_o = Signal(num_cols)
         self.cols_i = Signal(num_cols)
 
+        # Lines and columns captured in the current frame (capture domain), all of them unless in a region of interest
+        line_first = Signal(max=num_lines)
+        line_last = Signal(max=num_lines)
+        col_first = Signal(max=max(num_cols, 2))
+        col_last = Signal(max=max(num_cols, 2))
+        line_mask = Signal(num_lines)
+
+        # Columns driven high during a scan step: all of them, or only the current one in matrix mode
+        col_mask = Signal(num_cols)
+        last_col = Signal()     # Last scan step of the frame
+        if hadamard:
+            patterns = Array(sum(1 << c for c in range(num_cols) if bin(k & (c + 1)).count("1") % 2 == 0)
+                for k in range(steps))
+            self.comb += [
+                col_mask.eq(patterns[self.col_id]),
+                last_col.eq(self.col_id == steps - 1),
+            ]
+        elif matrix:
+            self.comb += [
+                col_mask.eq(1 << self.col_id),
+                last_col.eq(self.col_id == col_last),
+            ]
+        else:
+            self.comb += [
+                col_mask.eq(2**num_cols - 1),
+                last_col.eq(1),
+            ]
+
         ### CSR ###
 
+        # Data width out of the processing stages (FIFO, capdata)
+        ow = sw + 1 if hadamard else sw   # Width of the values (signed Hadamard decoding)
+        fw = 32 if with_packing or with_header else ow
         # Data register
-        self.capdata = CSR(dw)
+        self.capdata = CSR(fw)
 
         # Status register fields
         fields = [
@@ -61,10 +987,177 @@ class CapTouch(Module, AutoCSR):
                 ("1", "ENABLED", "Starts the capture")]),
             ])
 
+        # Configuration register
+        self.config = CSRStorage(fields=[
+            CSRField("auto", size=1, description="Free-running mode : a new frame is started every ``period`` cycles, no need to write ``ctrl.start``"),
+            CSRField("mean", size=1, description="Oversampling : output the mean of the captures instead of their sum"),
+        ] + ([
+            CSRField("pack", size=2, description="Samples per FIFO word (``capdata`` read) : 0 = one, 1 = two 16-bit, 2 = four 8-bit"),
+        ] if with_packing else []) + ([
+            CSRField("stream", size=1, description="Frames out on ``source`` (stream) instead of ``capdata``"),
+        ] if not with_source else []))
+
+        # Inter-frame period (auto mode), in cycles from the start of a frame to the start of the next one
+        self.period = CSRStorage(32, reset=0)
+
+        # Timeout (number of cycles to wait max, dependent on freq)
+        self.timeout = CSRStorage(dw, reset=max_timeout)
+
+        # Oversampling : 2**oversampling captures accumulated per sample (clamped to max_oversampling)
+        if max_oversampling > 1:
+            self.oversampling = CSRStorage(bits_for(log2_int(max_oversampling)), reset=0)
+            os_setting = Signal(len(self.oversampling.storage))
+            os_shift = Signal(len(self.oversampling.storage))
+            self.comb += If(self.oversampling.storage > log2_int(max_oversampling),
+                os_setting.eq(log2_int(max_oversampling))
+            ).Else(
+                os_setting.eq(self.oversampling.storage)
+            )
+        else:
+            os_shift = 0
+        os_last = Signal(max=max(max_oversampling, 2))
+        self.comb += os_last.eq((1 << os_shift) - 1)
+
+        # Frames not captured in auto mode because the FIFO had no room left for a whole frame (one per frame
+        # slot : period, or the duration of the last frame when the period is shorter)
+        self.dropped = CSRStatus(16)
+
+        # Interrupt coalescing : the event fires once "frames" whole frames are in (FIFO, or RAM with the DMA),
+        # or "timeout" cycles after the first of them (0 : no timeout)
+        self.coalesce = CSRStorage(fields=[
+            CSRField("frames", size=8, reset=1, description="Whole frames per interrupt (0 counts as 1)"),
+        ])
+        self.coalesce_timeout = CSRStorage(32, reset=0)
+
+        # Whole frames in the FIFO
+        self.frames = CSRStatus(8)
+
+        # Self-capacitance pre-scan (capture cycles)
+        if with_prescan:
+            self.prescan = CSRStorage(fields=[
+                CSRField("enable", size=1, description="Pre-scan before each frame, the mutual scan only runs on a touch"),
+            ])
+            self.prescan_threshold = CSRStorage(dw, reset=max_timeout)  # Touch : a line or column still low after it
+            self.prescan_time = CSRStatus(dw)       # Last pre-scan : cycles until all were up (threshold on a touch)
+            self.prescan_skipped = CSRStatus(32)    # Frames not scanned (no touch)
+
+        # Free-running cycle counter (sys), time base of the frame timestamps (latency : cycles - timestamp)
+        if with_header:
+            self.cycles = CSRStatus(32)
+
+        # Region of interest : window of lines (and columns in matrix mode), inclusive
+        if with_roi:
+            self.roi = CSRStorage(fields=[
+                CSRField("enable", size=1, description="Capture the window only, except for the full scans (write the window between frames)"),
+                CSRField("line_first", size=bits_for(num_lines - 1), reset=0),
+                CSRField("line_last", size=bits_for(num_lines - 1), reset=num_lines - 1),
+            ] + ([
+                CSRField("col_first", size=bits_for(num_cols - 1), reset=0),
+                CSRField("col_last", size=bits_for(num_cols - 1), reset=num_cols - 1),
+            ] if matrix else []))
+            # Full scan every roi_period frames (the first one after roi.enable), 0 : only the first one
+            self.roi_period = CSRStorage(16, reset=0)
+            self.roi_full = CSRStatus()     # The next frame is a full scan
+
+        # Registers used by the capture (in its clock domain)
+        timeout = Signal(dw)
+        mean = Signal()
+        settings = [(self.timeout.storage, timeout), (self.config.fields.mean, mean)]
+        if max_oversampling > 1:
+            settings.append((os_setting, os_shift))
+        prescan = Signal()
+        prescan_threshold = Signal(dw)
+        if with_prescan:
+            settings += [(self.prescan.fields.enable, prescan), (self.prescan_threshold.storage, prescan_threshold)]
+        for csr, setting in settings:
+            if cdc:
+                self.specials += MultiReg(csr, setting, clock_domain)
+            else:
+                self.comb += setting.eq(csr)
+
+        # Window of the current frame : set at the end of the previous frame on the sys side
+        if with_roi:
+            roi_frame = Signal()    # The frame is captured in the window (sys)
+            roi = Signal()
+            roi_window = [
+                (self.roi.fields.line_first, line_first, 0),
+                (self.roi.fields.line_last, line_last, num_lines - 1),
+            ]
+            if matrix:
+                roi_window += [
+                    (self.roi.fields.col_first, col_first, 0),
+                    (self.roi.fields.col_last, col_last, num_cols - 1),
+                ]
+            else:
+                self.comb += [col_first.eq(0), col_last.eq(num_cols - 1)]
+            for csr, setting, full in [(roi_frame, roi, 0)] + roi_window:
+                value = Signal(len(setting))
+                if cdc:
+                    self.specials += MultiReg(csr, value, clock_domain)
+                else:
+                    self.comb += value.eq(csr)
+                if setting is roi:
+                    self.comb += roi.eq(value)
+                else:
+                    self.comb += setting.eq(Mux(roi, value, full))
+            self.comb += line_mask.eq(Cat(*[(line_first <= a) & (a <= line_last) for a in range(num_lines)]))
+        else:
+            self.comb += [
+                line_first.eq(0),
+                line_last.eq(num_lines - 1),
+                col_first.eq(0),
+                col_last.eq(num_cols - 1),
+                line_mask.eq(2**num_lines - 1),
+            ]
+        # Samples out of the FSM, one per cycle, last is set on the last sample of a frame
+        samples = stream.Endpoint([("data", sw)])
+
+        # Processing stages, between the FSM and the FIFO
+        stages = []
+        if with_filter:
+            self.submodules.filter = CapTouchFilter(steps*num_lines, sw)
+            stages.append(self.filter)
+        if hadamard:
+            self.submodules.hadamard = CapTouchHadamard(num_lines, num_cols, steps, sw)
+            stages.append(self.hadamard)
+        if with_baseline:
+            self.submodules.baseline = CapTouchBaseline(self.frame_words, sw, baseline_shift)
+            stages.append(self.baseline)
+        if with_touches:
+            self.submodules.touches = CapTouchTouches(num_lines, num_cols if matrix else 1, ow, max_touches, touch_frac)
+            if with_baseline:
+                self.comb += self.touches.signed.eq(self.baseline.ctrl.fields.delta)
+            if hadamard:
+                self.comb += self.touches.signed.eq(1)
+            stages.append(self.touches)
+        if with_packing:
+            self.submodules.packer = CapTouchPacker(ow)
+            self.comb += self.packer.mode.eq(self.config.fields.pack)
+            if with_baseline:
+                self.comb += self.packer.signed.eq(self.baseline.ctrl.fields.delta)
+            if hadamard:
+                self.comb += self.packer.signed.eq(1)
+            stages.append(self.packer)
+        if with_header:
+            self.submodules.framer = CapTouchFramer(32 if with_packing else ow)
+            stages.append(self.framer)
+
         # FIFO
-        self.fifo = fifo = stream.SyncFIFO([("data", dw)], fifo_depth, buffered=False)
+        self.fifo = fifo = stream.SyncFIFO([("data", fw)], fifo_depth, buffered=False)
         self.submodules += fifo
 
+        endpoint = samples
+        if cdc:
+            # Capture domain --> sys, deep enough for a whole frame (the serialisation does not wait)
+            self.submodules.cdc = ClockDomainsRenamer({"write": clock_domain, "read": "sys"})(
+                stream.AsyncFIFO([("data", sw)], max(2**bits_for(steps*num_lines - 1), 4), buffered=True))
+            self.comb += samples.connect(self.cdc.sink)
+            endpoint = self.cdc.source
+        for stage in stages:
+            self.comb += endpoint.connect(stage.sink)
+            endpoint = stage.source
+        self.comb += endpoint.connect(fifo.sink)
+
         # IRQ
         self.submodules.ev = EventManager()
         self.ev.captouch_done = EventSourceProcess(edge="rising")
@@ -74,83 +1167,600 @@ class CapTouch(Module, AutoCSR):
 
         # FIFO module -> CPU
 
-        self.submodules.fsm = FSM(reset_state="IDLE")
+        fsm = FSM(reset_state="IDLE")
+        if cdc:
+            fsm = ClockDomainsRenamer(clock_domain)(fsm)
+        self.submodules.fsm = fsm
+        msync = getattr(self.sync, clock_domain)
+
+        # Frames are started on the sys side (room in the FIFO), busy until the end of the frame
+        go = Signal()           # Start of a frame (sys)
+        skip = Signal()         # Frame not started, FIFO still holding previous frames (sys, auto mode)
+        busy = Signal()
+        frame_end = Signal()    # Frame over (sys)
+        start = Signal()        # Start of a frame (capture domain)
+        capture_end = Signal()  # Last capture of the frame over (capture domain)
+        idle_end = Signal()     # Frame over after the pre-scan, no touch (capture domain)
+        idle_frame = Signal()   # Frame over without any sample (sys)
+        results = Signal()      # Results of the frame still on their way to the CSRs (sys)
+        if cdc:
+            self.submodules.start_sync = PulseSynchronizer("sys", clock_domain)
+            self.comb += [
+                self.start_sync.i.eq(go),
+                start.eq(self.start_sync.o),
+                # Once the last sample is out of the async FIFO (or the pre-scan found no touch)
+                frame_end.eq((self.cdc.source.valid & self.cdc.source.ready & self.cdc.source.last) | idle_frame),
+            ]
+            if with_prescan:
+                self.submodules.idle_sync = PulseSynchronizer(clock_domain, "sys")
+                self.comb += [
+                    self.idle_sync.i.eq(idle_end),
+                    idle_frame.eq(self.idle_sync.o),
+                ]
+        else:
+            self.comb += [
+                start.eq(go),
+                frame_end.eq(capture_end | idle_end),
+                idle_frame.eq(idle_end),
+            ]
+
+        # Auto-retrigger : cycles elapsed since the start of the last frame
+        frame_timer = Signal(32)
+        frame_start = Signal()
+        self.sync += If(frame_start,
+                frame_timer.eq(0)
+            ).Elif(frame_timer != 2**32-1,
+                frame_timer.eq(frame_timer + 1)
+            )
+        self.comb += frame_start.eq(go | skip)
+        # Frame slot for the dropped frames : a frame is only dropped once a whole frame could have been captured
+        # (period 0 : frames back to back, the FIFO being full does not drop one frame per cycle)
+        frame_cycles = Signal(32)   # Duration of the last frame
+        slot_over = Signal()
+        self.sync += If(busy & frame_end,
+                frame_cycles.eq(frame_timer)
+            )
+        self.comb += slot_over.eq((frame_timer >= self.period.storage) & (frame_timer >= frame_cycles))
+        self.sync += [
+            If(go,
+                busy.eq(1),
+            ).Elif(frame_end,
+                busy.eq(0),
+                self.ctrl.storage.eq(0),
+            ),
+            If(skip,
+                self.dropped.status.eq(self.dropped.status + 1),
+            ),
+        ]
+        if with_header:
+            # Frame header : frames started or dropped, start of the frame
+            cycles = self.cycles.status
+            sequence = Signal(32)
+            frame_time = Signal(32)
+            framed = Signal()   # The frame has a header (no samples in detection mode)
+            header = Signal()
+            self.comb += header.eq(~self.baseline.ctrl.fields.detect if with_baseline else 1)
+            self.sync += [
+                cycles.eq(cycles + 1),
+                If(frame_start,
+                    sequence.eq(sequence + 1),
+                ),
+                If(go,
+                    frame_time.eq(cycles),
+                    framed.eq(header),
+                ),
+            ]
+            self.comb += [
+                self.framer.start.eq(go & header),
+                self.framer.timestamp.eq(cycles),
+                self.framer.sequence.eq(sequence),
+                self.framer.end.eq(frame_end & framed),
+                self.framer.duration.eq(cycles - frame_time),
+                self.framer.empty.eq(idle_frame),
+            ]
+        if with_roi:
+            # Frames since the last full scan
+            roi_count = Signal(16)
+            self.comb += [
+                self.roi_full.status.eq(~self.roi.fields.enable | (roi_count == 0)),
+                roi_frame.eq(~self.roi_full.status),
+            ]
+            self.sync += If(~self.roi.fields.enable,
+                    roi_count.eq(0),
+                ).Elif(frame_end,
+                    If((self.roi_period.storage != 0) & (roi_count == self.roi_period.storage - 1),
+                        roi_count.eq(0),
+                    ).Elif(roi_count != 2**16-1,
+                        roi_count.eq(roi_count + 1),
+                    )
+                )
+        # Serialisation of shadow (fill the FIFO), runs while the next capture is measured
+        ser_start = Signal()
+        ser_busy = Signal()
+        ser_last = Signal()     # Last capture of a frame being serialised
+        ser_line_last = Signal(max=num_lines)   # Last line of the capture being serialised (the window can change at the end of a frame)
+        if not timestamps:
+            self.comb += [
+                samples.valid.eq(ser_busy),
+                samples.data.eq(shadow[self.loop_id]),
+                samples.last.eq((self.loop_id == ser_line_last) & ser_last),
+            ]
+            msync += If(ser_start,
+                    ser_busy.eq(1),
+                    ser_last.eq(last_col),
+                    ser_line_last.eq(line_last),
+                    self.loop_id.eq(line_first),
+                ).Elif(ser_busy,
+                    self.loop_id.eq(self.loop_id + 1),
+                    If(self.loop_id == ser_line_last,
+                        ser_busy.eq(0),
+                        self.loop_id.eq(0),
+                    )
+                )
+
+        # Room left in the FIFO for a whole frame (on top of the samples still on their way)
+        room = Signal()
+        hold = Signal()         # A stage still working on the previous frame
+        holding = ([self.hadamard.busy] if hadamard else []) + ([self.touches.busy] if with_touches else [])
+        # Samples in the processing stages : one per stage output register (the stages do not wait for
+        # the FIFO, every one of them has to be counted)
+        stage_valid = [stage.source.valid for stage in stages] + holding
+        in_flight = Signal(max=num_lines + len(stage_valid) + 6)
+        stage_busy = Signal(max=len(stage_valid) + 2)
+        if holding:
+            self.comb += hold.eq(reduce(or_, holding))
+        if stages:
+            self.comb += stage_busy.eq(reduce(add, stage_valid))
+        framer_level = self.framer.level if with_header else 0
+        if cdc:
+            # Nothing left in the capture domain and the async FIFO once the frame is over
+            self.comb += in_flight.eq(stage_busy + framer_level)
+        else:
+            self.comb += in_flight.eq(Mux(ser_busy, num_lines - self.loop_id, 0) + stage_busy + framer_level)
+        self.comb += [
+            room.eq(fifo.level + in_flight <= fifo_depth - out_words),
+            go.eq(self.trig & room & ~busy & ~hold),
+            skip.eq(self.config.fields.auto & slot_over & ~room & ~busy),
+        ]
 
         self.comb += [
             # FIFO --> CSR.
             self.capdata.w.eq(fifo.source.data),
-            # capdata.we == 1 : one value out of the FIFO automatically after each read from the bus
-            #fifo.source.ready.eq(self.capdata.we),
-            If(self.capdata.we, fifo.source.ready.eq(1)),
-            #fifo.source.ready.eq(self.ev.captouch_done.clear | self.capdata.we),
             # Status.
             self.status.fields.fifo_empty.eq(~fifo.source.valid),
             self.status.fields.fifo_full.eq(~fifo.sink.ready),
-            # IRQ (When FIFO becomes non-empty).
-            self.ev.captouch_done.trigger.eq(fifo.source.valid)
+            self.status.fields.done.eq(~busy & (in_flight == 0) & ~results),
+            # Start a capture on CPU request or when the period is over (auto mode).
+            self.trig.eq((self.ctrl.storage==True) | (self.config.fields.auto & (frame_timer >= self.period.storage))),
+        ]
+
+        # Frames out of the FIFO, as a stream (same words as capdata, last set on the last word of a frame)
+        self.source = stream.Endpoint([("data", fw)])
+        if with_source:
+            self.comb += fifo.source.connect(self.source)
+        else:
+            self.comb += [
+                # capdata.we == 1 : one value out of the FIFO automatically after each read from the bus
+                #fifo.source.ready.eq(self.capdata.we),
+                If(self.capdata.we, fifo.source.ready.eq(1)),
+                #fifo.source.ready.eq(self.ev.captouch_done.clear | self.capdata.we),
+                # Stream enabled : source is the consumer, capdata reads do not pop
+                If(self.config.fields.stream,
+                    fifo.source.connect(self.source),
+                ),
+            ]
+
+        # Whole frames in the FIFO : in with their last sample, out when it is read
+        fifo_in = Signal()
+        fifo_out = Signal()
+        self.comb += [
+            fifo_in.eq(fifo.sink.valid & fifo.sink.ready & fifo.sink.last),
+            fifo_out.eq(fifo.source.valid & fifo.source.ready & fifo.source.last),
+        ]
+        self.sync += self.frames.status.eq(self.frames.status + fifo_in - fifo_out)
+
+        # Whole frames in : into the FIFO, or written into RAM by the DMA
+        frame_in = Signal()
+        self.comb += frame_in.eq(fifo_in)
+
+        if with_dma:
+            # DMA enabled : FIFO --> RAM, IRQ when whole frames have been written
+            self.submodules.dma = CapTouchDMA(fw, out_words)
+            self.comb += If(self.dma.ctrl.fields.enable,
+                fifo.source.connect(self.dma.sink),
+                frame_in.eq(self.dma.frame_done),
+            )
+
+        # IRQ : set when a batch of frames is complete, until the event is cleared
+        batch = Signal(8)           # Frames in since the last interrupt
+        batch_timer = Signal(32)    # Cycles since the first of them
+        batch_ready = Signal()
+        batch_fire = Signal()
+        self.comb += [
+            batch_fire.eq((batch != 0) & (
+                (batch >= self.coalesce.fields.frames) |
+                ((self.coalesce_timeout.storage != 0) & (batch_timer >= self.coalesce_timeout.storage)))),
+            self.ev.captouch_done.trigger.eq(batch_ready),
+        ]
+        self.sync += [
+            # An acknowledge wins over a new batch : the batch is kept and fires on the next cycle (new edge)
+            If(batch_fire & ~self.ev.captouch_done.clear,
+                batch_ready.eq(1),
+                batch.eq(frame_in),
+            ).Else(
+                If(self.ev.captouch_done.clear,
+                    batch_ready.eq(0),
+                ),
+                If(frame_in & (batch != 2**8-1),
+                    batch.eq(batch + 1),
+                ),
+            ),
+            If(batch_fire | ((batch == 0) & ~frame_in),
+                batch_timer.eq(0),
+            ).Elif(batch_timer != 2**32-1,
+                batch_timer.eq(batch_timer + 1),
+            ),
         ]
 
+        if with_baseline:
+            # Detection mode : nothing goes to the FIFO, IRQ when the touched bitmap changes
+            self.comb += If(self.baseline.ctrl.fields.detect,
+                room.eq(1),
+                self.ev.captouch_done.trigger.eq(self.baseline.change),
+            )
+
 
         self.fsm.act("IDLE",
             #If(self.ctrl.fields.start != 0,
-            If(self.ctrl.storage==True,
-                NextState("RUN")),
+            If(start,
+                If(prescan,
+                    NextState("PRESCAN_DISCHARGE"),
+                ).Else(
+                    NextState("RUN"),
+                ) if with_prescan else NextState("RUN"),
+            ),
             # All lines set to zero and columns to one
             self.lines_oe.eq(2**num_lines - 1),
             self.lines_o.eq(0),
             self.cols_oe.eq(2**num_cols - 1),
-            self.cols_o.eq(2**num_cols - 1),
+            self.cols_o.eq(col_mask),
             NextValue(counter, 0),
+            NextValue(seen, 0),
+            NextValue(self.col_id, col_first),
             #NextValue(self.ctrl.fields.start, 0),  # Reset the register because the pulse parameter does not do what you think it should do
         )
 
-        self.fsm.act("RUN",
-            # Switch each line to input/read mode
-            self.lines_oe.eq(0),
-            # Detect if each line at 1
-            If( self.lines_i >= (2**num_lines-1),
-                NextState("SAVE")
-            ),
-            # Or timeout
-            If( counter == timeout, #(2**dw-1),
-                NextValue(buf[0], self.lines_i[0]), #DEBUG
-                NextValue(buf[1], self.lines_i[1]), #DEBUG
-                NextValue(buf[2], self.lines_i[2]), #DEBUG
-                NextValue(buf[3], self.lines_i[3]), #DEBUG
-                NextState("SAVE")
+        # End of a capture : all lines up, or timeout
+        run_end = Signal()
+        timed_out = Signal()
+        self.comb += [
+            timed_out.eq(counter >= timeout),
+            run_end.eq(((self.lines_i & line_mask) == line_mask) | timed_out),
+        ]
+
+        if with_prescan:
+            # Self-capacitance pre-scan : lines and columns discharged, then released and timed together
+            prescan_up = Signal()
+            prescan_cycles = Signal(dw)     # Duration of the last pre-scan (capture domain)
+            self.sync += If(idle_frame,
+                    self.prescan_skipped.status.eq(self.prescan_skipped.status + 1),
+                )
+            if cdc:
+                # Stable from the end of the pre-scan to the end of the frame : taken one cycle after the end of
+                # the frame (the end of an idle frame comes through a synchroniser as long as the value's)
+                prescan_time = Signal(dw)
+                prescan_end = Signal()
+                self.specials += MultiReg(prescan_cycles, prescan_time)
+                self.sync += [
+                    prescan_end.eq(frame_end),
+                    If(prescan_end,
+                        self.prescan_time.status.eq(prescan_time),
+                    )
+                ]
+                self.comb += results.eq(prescan_end)
+            else:
+                self.comb += self.prescan_time.status.eq(prescan_cycles)
+            self.comb += prescan_up.eq(((self.lines_i & line_mask) == line_mask) & (self.cols_i == 2**num_cols - 1))
+            self.fsm.act("PRESCAN_DISCHARGE",
+                self.lines_oe.eq(2**num_lines - 1),
+                self.lines_o.eq(0),
+                self.cols_oe.eq(2**num_cols - 1),
+                self.cols_o.eq(0),
+                If(counter == discharge_cycles - 1,
+                    NextValue(counter, 0),
+                    NextState("PRESCAN"),
+                ).Else(
+                    NextValue(counter, counter + 1),
+                )
+            )
+            self.fsm.act("PRESCAN",
+                self.lines_oe.eq(0),
+                self.cols_oe.eq(0),
+                If(prescan_up,
+                    # No touch : frame over, nothing sent
+                    NextValue(prescan_cycles, counter),
+                    NextValue(counter, 0),
+                    idle_end.eq(1),
+                    NextState("IDLE"),
+                ).Elif((counter >= prescan_threshold) | timed_out,
+                    # Touch : mutual scan
+                    NextValue(prescan_cycles, counter),
+                    NextValue(counter, 0),
+                    NextState("DISCHARGE"),
+                ).Else(
+                    NextValue(counter, counter + 1),
+                )
+            )
+
+        if not timestamps:
+            self.fsm.act("RUN",
+                # Switch each line to input/read mode
+                self.lines_oe.eq(0),
+                # Detect if each line at 1, or timeout
+                If(run_end,
+                    NextValue(counter, 0),
+                    If(self.os_id == os_last,
+                        NextValue(self.os_id, 0),
+                        NextState("SAVE")
+                    ).Else(
+                        # Oversampling : capture again, accumulating into buf
+                        NextValue(self.os_id, self.os_id + 1),
+                        NextState("DISCHARGE")
+                    )
+                ).Else(
+                    NextValue(counter, counter + 1),
+                )
+            )
+
+            # Add that same block for each line in the FSM
+            for a in range(num_lines):
+                self.fsm.act("RUN",
+                    If((self.lines_i[a] == 1) & ~seen[a],
+                       NextValue(buf[a], buf[a] + counter),
+                       NextValue(seen[a], 1),
+                    ).Elif((counter >= timeout) & ~seen[a],
+                       NextValue(buf[a], buf[a] + timeout),   # Line never went up
+                       NextValue(seen[a], 1),
+                       )
+                    )
+
+            # Hand the results over to the serialiser (double buffering) : a single cycle,
+            # unless the previous capture is still being serialised (capture shorter than num_lines cycles)
+            self.fsm.act("SAVE",
+                If(~ser_busy | (self.loop_id == ser_line_last),
+                    ser_start.eq(1),
+                    If(last_col,
+                        NextValue(self.col_id, 0),
+                        capture_end.eq(1),
+                        NextState("IDLE"),
+                    ).Else(
+                        # Matrix mode only : next column
+                        NextValue(self.col_id, self.col_id + 1),
+                        NextState("DISCHARGE"),
+                    )
+                )
+            )
+            for a in range(num_lines):
+                self.fsm.act("SAVE",
+                    If(ser_start,
+                        If(mean,
+                            NextValue(shadow[a], buf[a] >> os_shift),
+                        ).Else(
+                            NextValue(shadow[a], buf[a]),
+                        ),
+                        NextValue(buf[a], 0),
+                    )
+                )
+
+        else:
+            # Edge timestamps : each cycle where lines go up (and at timeout), counter is written once into
+            # the events memory and these lines keep the address (rank) of their event. A line only costs
+            # a seen bit and a rank register, the timestamps are read back after the capture.
+            events = Memory(dw, num_lines)
+            ev_wr = events.get_port(write_capable=True, clock_domain=clock_domain)
+            ev_rd = events.get_port(clock_domain=clock_domain)
+            self.specials += events, ev_wr, ev_rd
+            n_events = Signal(max=num_lines + 1)
+            rank = Array(Signal(max=max(num_lines, 2)) for a in range(num_lines))
+            new = Signal(num_lines)     # Lines seen up for the first time in this cycle (all the others at timeout)
+            self.comb += new.eq(Mux(timed_out, ~seen, self.lines_i & ~seen))
+
+            self.fsm.act("RUN",
+                # Switch each line to input/read mode
+                self.lines_oe.eq(0),
+                If(new != 0,
+                    ev_wr.adr.eq(n_events),
+                    ev_wr.dat_w.eq(Mux(timed_out, timeout, counter)),
+                    ev_wr.we.eq(1),
+                    NextValue(n_events, n_events + 1),
+                    NextValue(seen, seen | new),
+                ),
+                NextValue(self.loop_id, line_first),
+                If(run_end,
+                    NextValue(counter, 0),
+                    NextState("READ"),
+                ).Else(
+                    NextValue(counter, counter + 1),
+                )
+            )
+            for a in range(num_lines):
+                self.fsm.act("RUN",
+                    If(new[a],
+                        NextValue(rank[a], n_events),
+                    )
+                )
+
+            # Read back : timestamp of each line (sync read, one cycle of latency), added to the previous
+            # captures (oversampling), out to the processing stages after the last capture of the step
+            issue = Signal()        # Read of line loop_id
+            issued = Signal()       # All lines read, waiting for the last one
+            rd_valid = Signal()
+            rd_line = Signal(max=max(num_lines, 2))
+            value = Signal(sw)
+            msync += [
+                rd_valid.eq(issue),
+                rd_line.eq(self.loop_id),
+            ]
+            self.comb += ev_rd.adr.eq(rank[self.loop_id])
+            if max_oversampling > 1:
+                # Sums of the captures of the current step
+                acc = Memory(sw, num_lines)
+                acc_wr = acc.get_port(write_capable=True, clock_domain=clock_domain)
+                acc_rd = acc.get_port(clock_domain=clock_domain)
+                self.specials += acc, acc_wr, acc_rd
+                self.comb += [
+                    acc_rd.adr.eq(self.loop_id),
+                    value.eq(ev_rd.dat_r + Mux(self.os_id == 0, 0, acc_rd.dat_r)),
+                    acc_wr.adr.eq(rd_line),
+                    acc_wr.dat_w.eq(value),
+                    acc_wr.we.eq(rd_valid & (self.os_id != os_last)),
+                ]
+            else:
+                self.comb += value.eq(ev_rd.dat_r)
+            self.comb += [
+                samples.valid.eq(rd_valid & (self.os_id == os_last)),
+                samples.data.eq(Mux(mean, value >> os_shift, value)),
+                samples.last.eq((rd_line == line_last) & last_col),
+            ]
+
+            self.fsm.act("READ",
+                issue.eq(~issued),
+                If(~issued,
+                    If(self.loop_id == line_last,
+                        NextValue(issued, 1),
+                    ).Else(
+                        NextValue(self.loop_id, self.loop_id + 1),
+                    )
+                ),
+                If(rd_valid & (rd_line == line_last),
+                    NextValue(issued, 0),
+                    NextValue(self.loop_id, 0),
+                    NextValue(n_events, 0),
+                    If(self.os_id != os_last,
+                        # Oversampling : capture again, accumulating into acc
+                        NextValue(self.os_id, self.os_id + 1),
+                        NextState("DISCHARGE"),
+                    ).Elif(last_col,
+                        NextValue(self.os_id, 0),
+                        NextValue(self.col_id, 0),
+                        capture_end.eq(1),
+                        NextState("IDLE"),
+                    ).Else(
+                        # Matrix mode only : next column
+                        NextValue(self.os_id, 0),
+                        NextValue(self.col_id, self.col_id + 1),
+                        NextState("DISCHARGE"),
+                    )
+                )
+            )
+
+        # Between two captures of a frame (matrix mode, oversampling) : lines back to zero for discharge_cycles
+        self.fsm.act("DISCHARGE",
+            NextValue(seen, 0),
+            self.lines_oe.eq(2**num_lines - 1),
+            self.lines_o.eq(0),
+            self.cols_oe.eq(2**num_cols - 1),
+            self.cols_o.eq(col_mask),
+            If(counter == discharge_cycles - 1,
+                NextValue(counter, 0),
+                NextState("RUN"),
             ).Else(
                 NextValue(counter, counter + 1),
             )
         )
 
-        # Add that same block for each line in the FSM
-        for a in range(num_lines):
-            self.fsm.act("RUN",
-                If((self.lines_i[a] == 1) & ( buf[a] == 0 ),
-                   NextValue(buf[a], counter),
-                   )
-                )
-
-        self.fsm.act("SAVE",
-            # "Serialization" (fill the FIFO)
-            #NextValue(fifo.sink.data, 0xDEAD0000 +self.loop_id),
-            NextValue(fifo.sink.data, buf[self.loop_id]),
-            NextValue(buf[self.loop_id], 0),
-            NextValue(self.loop_id, self.loop_id+1),
-            NextValue(fifo.sink.valid, 1),
-            If(self.loop_id == num_lines - 1,
-                NextState("WAIT"),
-                NextValue(self.loop_id, 0),
-                #NextValue(self.ctrl.fields.start, 0),  # Reset the register because the pulse parameter does not do what you think it should do
-               )#).Else(
-            #    NextState("SAVE_LOOP")
-            #)
-        )
-
-        self.fsm.act("WAIT",
-            NextValue(fifo.sink.valid, 0),
-
-            #NextValue(self.ev.captouch_done.trigger, 1),    # IRQ (When capture is done and FIFO filled)
-            NextValue(self.ctrl.storage, 0),
-            NextState("IDLE"),
-        )
+        if with_perf:
+            self.submodules.perf = CapTouchPerf(num_lines, len(fifo.level), clock_domain)
+            self.comb += [
+                self.perf.run.eq(self.fsm.ongoing("RUN")),
+                self.perf.timeouts.eq(Mux(self.fsm.ongoing("RUN") & timed_out, ~seen & line_mask, 0)),
+                self.perf.capture_end.eq(capture_end),
+                self.perf.level.eq(fifo.level),
+                self.perf.dropped.eq(skip),
+                self.perf.frame.eq(frame_in),
+            ]
+
+
+# Several panels (CapTouch engines on their own pads) capturing in parallel, one capdata register and one IRQ
+# panels : list of (num_lines, num_cols), kwargs : CapTouch options common to all the panels (with_dma not supported)
+# Engine i is "panel<i>" : its registers (timeout, config, period...) are set panel by panel, its lines/cols
+# signals wired to its pads. Frames are merged whole, panel by panel (round robin) : "panel" is the panel of the
+# frame being read through capdata. ctrl.start starts all the panels.
+class CapTouchPanels(Module, AutoCSR):
+    def __init__(self, panels, **kwargs):
+        assert not kwargs.get("with_dma"), "with_dma is not supported by CapTouchPanels"
+        self.engines = []
+        for i, (num_lines, num_cols) in enumerate(panels):
+            engine = CapTouch(num_lines, num_cols, with_source=True, **kwargs)
+            setattr(self.submodules, "panel{}".format(i), engine)
+            self.engines.append(engine)
+        self.frame_words = [engine.frame_words for engine in self.engines]
+        fw = len(self.engines[0].source.data)
+        pw = bits_for(len(panels) - 1)
+
+        # Merged frames
+        self.source = source = stream.Endpoint([("data", fw), ("panel", pw)])
+
+        ### CSR ###
+
+        self.capdata = CSR(fw)
+        self.panel = CSRStatus(pw, description="Panel of the frame being read")
+        self.status = CSRStatus(fields=[
+            CSRField("done", size=1, description="All panels done"),
+            CSRField("fifo_empty", size=1, description="No sample to read if at 1"),
+        ])
+        self.ctrl = CSRStorage(1, reset_less=True,
+            fields=[CSRField("start", size=1, description="Starts a capture on all the panels")])
+
+        # IRQ
+        self.submodules.ev = EventManager()
+        self.ev.captouch_done = EventSourceProcess(edge="rising")
+        self.ev.finalize()
+
+        ###
+
+        # Round robin between the panels, a frame is never interleaved with another one
+        sel = Signal(max=max(len(panels), 2))   # Panel of the frame being read, or first one to look at
+        cur = Signal(max=max(len(panels), 2))
+        in_frame = Signal()
+        # Between frames : first panel with a sample ready, starting from sel
+        first = {}
+        for start in range(len(panels)):
+            order = [(start + offset) % len(panels) for offset in range(len(panels))]
+            first[start] = [cur.eq(start)] + [If(self.engines[i].source.valid, cur.eq(i)) for i in reversed(order)]
+        self.comb += If(in_frame, cur.eq(sel)).Else(Case(sel, first))
+        cases = {}
+        for i, engine in enumerate(self.engines):
+            cases[i] = [
+                engine.source.connect(source, omit={"panel"}),
+                source.panel.eq(i),
+            ]
+        self.comb += Case(cur, cases)
+        self.sync += If(source.valid & source.ready,
+                in_frame.eq(~source.last),
+                If(~source.last,
+                    sel.eq(cur),
+                ).Elif(cur == len(panels) - 1,
+                    sel.eq(0),
+                ).Else(
+                    sel.eq(cur + 1),
+                )
+            )
+
+        # Start of all the panels, ctrl.start back to 0 once they are all over
+        engines_busy = Signal()
+        self.comb += engines_busy.eq(reduce(or_, [engine.ctrl.storage for engine in self.engines]))
+        for engine in self.engines:
+            self.sync += If(self.ctrl.re & self.ctrl.storage, engine.ctrl.storage.eq(1))
+        self.sync += If(~self.ctrl.re & ~engines_busy, self.ctrl.storage.eq(0))
+
+        self.comb += [
+            # Merged frames --> CSR
+            self.capdata.w.eq(source.data),
+            If(self.capdata.we, source.ready.eq(1)),
+            self.panel.status.eq(source.panel),
+            self.status.fields.done.eq(reduce(and_, [engine.status.fields.done for engine in self.engines])),
+            self.status.fields.fifo_empty.eq(~source.valid),
+            # IRQ (When a whole frame can be read)
+            self.ev.captouch_done.trigger.eq(reduce(or_, [engine.frames.status != 0 for engine in self.engines])),
+        ]
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Behavioural model of CapTouch (mutcaptouch.py) in NumPy, and a checker against the Migen simulation
+#
+# Rise times are given in cycles, as the counter value of the first cycle a line is seen at 1
+# (>= 1, a line never going up can be given any value >= timeout).
+# rise shape : (frames, 2**oversampling, steps, num_lines), steps = num_cols in matrix mode, 1 otherwise
+# (the oversampling axis can be omitted when oversampling is 0).
+# Baseline/delta stage not modelled : samples are raw counts.
+# Touch extraction (touches = True) : the words of a frame are its touch list (CapTouchTouches).
+# Spike rejection and IIR filter (spike, shift) : over the frames of rise, from a reset filter (CapTouchFilter).
+# Hadamard drive (hadamard=True) : steps = sub-scans, decoded as CapTouchHadamard (signed samples).
+
+import numpy as np
+
+from migen import *
+
+
+class CapTouchModel:
+    def __init__(self, num_lines, num_cols, matrix=False, max_timeout=2**16-1, max_oversampling=1,
+                 max_touches=4, touch_frac=4, hadamard=False):
+        self.num_lines = num_lines
+        self.num_cols = num_cols
+        self.matrix = matrix
+        self.hadamard = hadamard
+        self.steps = 2**bits_for(num_cols) if hadamard else num_cols if matrix else 1
+        self.frame_words = (num_cols if hadamard else self.steps)*num_lines
+        # Width of the samples out of the processing stages
+        self.sw = bits_for(max_timeout) + log2_int(max_oversampling) + (1 if hadamard else 0)
+        self.max_oversampling = max_oversampling
+        self.max_touches = max_touches
+        self.touch_frac = touch_frac
+        # Registers, same names and reset values as the CSRs
+        self.timeout = max_timeout
+        self.oversampling = 0
+        self.mean = False
+        self.pack = 0
+        self.touches = False
+        self.spike = 0
+        self.shift = 0
+        self.threshold = 2**(bits_for(max_timeout) + log2_int(max_oversampling)) - 1
+
+    def shape(self, frames):
+        return (frames, 2**self.oversampling, self.steps, self.num_lines)
+
+    # Samples of each frame, in FIFO order (index = col*num_lines + line) : (frames, frame_words)
+    def samples(self, rise):
+        rise = np.asarray(rise, dtype=np.int64)
+        if rise.ndim == 3:
+            rise = rise[:, np.newaxis]
+        assert rise.shape[1:] == self.shape(0)[1:], "rise shape should be {}".format(self.shape(rise.shape[0]))
+        # First edge, or timeout value for lines still low at timeout
+        values = np.minimum(rise, self.timeout).sum(axis=1)
+        if self.mean:
+            values >>= self.oversampling
+        values = self.filter(values.reshape(len(rise), -1)).reshape(values.shape)
+        if self.hadamard:
+            values = self.decode(values)
+        return values.reshape(len(rise), self.frame_words)
+
+    # Spike rejection and IIR filter of the raw samples (frames, sensors), the first frame loads the history
+    def filter(self, values):
+        if self.spike == 0 and self.shift == 0:
+            return values   # Filter off : no per frame pass
+        out = np.empty_like(values)
+        for f, raw in enumerate(values):
+            if f == 0:
+                prev = [raw]*3
+                state = raw << self.shift
+            if self.spike == 1:
+                spike = np.sort([raw, prev[0], prev[1]], axis=0)[1]
+            elif self.spike == 2:
+                window = np.sort([raw] + prev, axis=0)
+                spike = (window[1] + window[2]) >> 1
+            else:
+                spike = raw
+            state = state - (state >> self.shift) + spike
+            out[f] = state >> self.shift
+            prev = [raw] + prev[:2]
+        return out
+
+    # Drive pattern of the Hadamard sub-scans : (steps, num_cols), +1 high, -1 low
+    def patterns(self):
+        k = np.arange(self.steps)[:, np.newaxis]
+        c = np.arange(self.num_cols)[np.newaxis, :] + 1
+        parity = np.vectorize(lambda v: bin(v).count("1") % 2)(k & c)
+        return 1 - 2*parity
+
+    # Hadamard decoding of the sub-scans (frames, steps, num_lines) : (frames, num_cols, num_lines)
+    def decode(self, values):
+        sums = np.einsum("kc,fkl->fcl", self.patterns(), values)
+        return sums >> log2_int(self.steps)     # Arithmetic shift (floor), as the gateware
+
+    # Touch list of a frame of samples : [n, x, y, peak, x, y, peak...]
+    def touch_list(self, samples):
+        frac = self.touch_frac
+        rows = self.frame_words//self.num_lines
+        grid = np.pad(np.asarray(samples, dtype=np.int64).reshape(rows, self.num_lines), 1)
+        touches = []
+        for y in range(rows):
+            for x in range(self.num_lines):
+                nb = grid[y:y+3, x:x+3].ravel()     # nb[4] is the sensor, 0 outside of the panel
+                peak = nb[4]
+                if peak == 0 or peak < self.threshold:
+                    continue
+                if not (all(peak > nb[:4]) and all(peak >= nb[5:])):
+                    continue
+                weak = min(range(len(touches)), key=lambda i: touches[i][2]) if touches else 0
+                if len(touches) == self.max_touches and peak <= touches[weak][2]:
+                    continue
+                total = nb.sum()
+                sx = nb[2] + nb[5] + nb[8] - nb[0] - nb[3] - nb[6]
+                sy = nb[6] + nb[7] + nb[8] - nb[0] - nb[1] - nb[2]
+                tx = (x << frac) + np.sign(sx)*((abs(sx) << frac)//total)
+                ty = (y << frac) + np.sign(sy)*((abs(sy) << frac)//total)
+                if len(touches) == self.max_touches:
+                    touches[weak] = (tx, ty, peak)
+                else:
+                    touches.append((tx, ty, peak))
+        return [len(touches)] + [int(v) for t in touches for v in t]
+
+    # FIFO words (capdata reads) of each frame : (frames, words per frame), or a list of touch lists
+    def words(self, rise):
+        samples = self.samples(rise)
+        if self.touches:
+            return [self.touch_list(frame) for frame in samples]
+        if self.pack not in (1, 2):
+            return samples & (2**self.sw-1) if self.hadamard else samples    # Two's complement
+        bits = 16 if self.pack == 1 else 8
+        per_word = 32//bits
+        if self.hadamard:
+            samples = np.clip(samples, -2**(bits-1), 2**(bits-1)-1) & (2**bits-1)
+        else:
+            samples = np.minimum(samples, 2**bits-1)
+        # A frame starts with a new word, the unused lanes of its last word are 0
+        pad = -self.frame_words % per_word
+        samples = np.pad(samples, ((0, 0), (0, pad)))
+        lanes = samples.reshape(len(samples), -1, per_word)
+        return (lanes << (bits*np.arange(per_word))).sum(axis=2)
+
+
+# Random rise times in [low, high[, a fraction p_timeout of the lines never go up
+def random_rise(model, frames, low=1, high=64, p_timeout=0.0, rng=None):
+    rng = np.random.default_rng(rng)
+    rise = rng.integers(low, high, size=model.shape(frames))
+    rise[rng.random(rise.shape) < p_timeout] = model.timeout
+    return rise
+
+
+# Migen simulation of dut (CapTouch) with the same registers as model, frame by frame
+# Returns the FIFO words, the number of cycles (start to last sample in the FIFO) and the highest
+# FIFO level of each frame
+def simulate(dut, model, rise, vcd_name=None):
+    rise = np.asarray(rise, dtype=np.int64)
+    if rise.ndim == 3:
+        rise = rise[:, np.newaxis]
+    words = []
+    cycles = []
+    levels = []
+    now = [0]
+
+    def drive(frame):
+        for step in range(model.steps):
+            for capture in range(2**model.oversampling):
+                while ( yield dut.lines_oe ) != 0 :
+                    yield   # wait for the lines to be released (RUN)
+                delays = frame[capture][step]
+                i = 0
+                while ( yield dut.lines_oe ) == 0 :    # until the end of the capture (SAVE included)
+                    for j in range(model.num_lines):
+                        if delays[j] - 1 == i :
+                            yield dut.lines_i[j].eq(1)  # Seen by the counter on the next cycle
+                    i += 1
+                    yield
+                for j in range(model.num_lines):
+                    yield dut.lines_i[j].eq(0)  # Put all lines down (needed for simulation only)
+
+    @passive
+    def monitor():
+        while True:
+            now[0] += 1
+            if len(levels) > len(words):
+                levels[-1] = max(levels[-1], (yield dut.fifo.level))
+            yield
+
+    def generator():
+        yield from dut.timeout.write(model.timeout)
+        if hasattr(dut, "oversampling"):
+            yield from dut.oversampling.write(model.oversampling)
+        config = (model.mean << 1) | ((model.pack << 2) if hasattr(dut.config.fields, "pack") else 0)
+        yield from dut.config.write(config)
+        if hasattr(dut, "filter"):
+            yield from dut.filter.ctrl.write(model.spike | (model.shift << 2))
+        if hasattr(dut, "touches"):
+            yield from dut.touches.threshold.write(model.threshold)
+            yield from dut.touches.ctrl.write(model.touches)
+        for frame in rise:
+            levels.append(0)
+            start = now[0]
+            yield from dut.ctrl.write(1)
+            yield from drive(frame)
+            while ( yield dut.status.fields.done ) == 0 :
+                yield
+            cycles.append(now[0] - start)
+            data = []
+            while ( yield dut.fifo.source.valid ) != 0 :
+                data.append((yield from dut.capdata.read()))
+                yield
+            words.append(data)
+
+    run_simulation(dut, [generator(), monitor()], vcd_name=vcd_name)
+    return words, cycles, levels
+
+
+# Compare the model with the Migen simulation on a random sample of the frames, returns the mismatches
+# (frame, expected words, simulated words)
+def check(dut, model, rise, samples=8, rng=None):
+    rng = np.random.default_rng(rng)
+    rise = np.asarray(rise, dtype=np.int64)
+    picked = np.sort(rng.choice(len(rise), size=min(samples, len(rise)), replace=False))
+    expected = model.words(rise[picked])
+    simulated, _, _ = simulate(dut, model, rise[picked])
+    errors = []
+    for frame, e, s in zip(picked, expected, simulated):
+        if list(e) != s:
+            errors.append((frame, list(e), s))
+    return errors
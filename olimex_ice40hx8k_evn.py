@@ -17,6 +17,8 @@ from litex.gen import *
 from platforms import olimex_ice40hx8k_evn
 from litex.build.lattice.programmer import IceStormProgrammer
 
+from flash_image import flash_image
+
 from litex.soc.cores.ram import Up5kSPRAM
 from litex.soc.cores.clock import iCE40PLL
 from litex.soc.integration.soc_core import *
@@ -172,31 +174,15 @@ class BaseSoC(SoCCore):
 
 # Flash --------------------------------------------------------------------------------------------
 
-def flash(bios_flash_offset, target="olimex_ice40hx8k_evn"):
-    from litex.build.dfu import DFUProg
+def flash(bios_flash_offset, target="olimex_ice40hx8k_evn", full=False):
     prog = IceStormProgrammer()
-    bitstream  = open("build/"+target+"/gateware/"+target+".bin",  "rb")
-    bios       = open("build/"+target+"/software/bios/bios.bin", "rb")
-    image      = open("build/"+target+"/image.bin", "wb")
-    # Copy bitstream at 0x00000000
-    for i in range(0x00000000, 0x00030000):
-        b = bitstream.read(1)
-        if not b:
-            image.write(0xff.to_bytes(1, "big"))
-        else:
-            image.write(b)
-    # Copy bios at 0x00030000
-    for i in range(0x00000000, 0x00010000):
-        b = bios.read(1)
-        if not b:
-            image.write(0xff.to_bytes(1, "big"))
-        else:
-            image.write(b)
-    bitstream.close()
-    bios.close()
-    image.close()
-    print("Flashing bitstream (+bios)")
-    prog.flash(0x0, "build/"+target+"/image.bin")
+    bios_flash_offset = int(bios_flash_offset, 0) if isinstance(bios_flash_offset, str) else bios_flash_offset
+    # Bitstream at 0x00000000, bios at bios_flash_offset (64KB)
+    regions = [
+        (0x00000000,        bios_flash_offset, "build/"+target+"/gateware/"+target+".bin"),
+        (bios_flash_offset, 0x00010000,        "build/"+target+"/software/bios/bios.bin"),
+    ]
+    flash_image(prog, regions, "build/"+target+"/image.bin", full=full)
 
 # Build --------------------------------------------------------------------------------------------
 
@@ -206,6 +192,7 @@ def main():
     parser.add_target_argument("--sys-clk-freq",      default=25e6, type=float, help="System clock frequency.")
     parser.add_target_argument("--bios-flash-offset", default="0x30000",        help="BIOS offset in SPI Flash.")
     parser.add_target_argument("--flash",             action="store_true",      help="Flash Bitstream.")
+    parser.add_target_argument("--flash-full",        action="store_true",      help="Flash the whole image, even the unchanged regions.")
     parser.add_target_argument("--with-sram",         action="store_true",      help="Add external 512KB SRAM")
     args = parser.parse_args()
 
@@ -219,7 +206,7 @@ def main():
         builder.build(**parser.toolchain_argdict)
 
     if args.flash:
-        flash(args.bios_flash_offset)
+        flash(args.bios_flash_offset, full=args.flash_full)
 
 if __name__ == "__main__":
     main()
@@ -5,20 +5,163 @@
 #include <generated/soc.h>
 
 #include <irq.h>
+#include <system.h>
+#include <libbase/uart.h>
+#include <libbase/console.h>
 #include "hardmuca.h"
 
 static volatile unsigned int int_counter = 0;
 
+#define HMC_EV_DONE (1 << CSR_CAPTOUCH_EV_PENDING_CAPTOUCH_DONE_OFFSET)
+#define HMC_COALESCE_FRAMES 1         // Frames per interrupt
+#define HMC_COALESCE_TIMEOUT 0        // Cycles, 0 : none
+#define HMC_FILTER_SPIKE 1            // 0 : off, 1 : median of 3, 2 : min/max of 4 rejected
+#define HMC_FILTER_SHIFT 2            // IIR time constant, 2**shift frames (0 : off)
+
+#ifndef CSR_CAPTOUCH_DMA_BASE
+/* Frames drained from capdata by the ISR (CAPTOUCH_FRAME_WORDS samples each).
+ * Slot hmc_ring_wr is filled by the ISR, frames from hmc_ring_rd up to it are complete.
+ * The ring is full when hmc_ring_wr + 1 == hmc_ring_rd : the frame being received is dropped. */
+static uint32_t hmc_ring[HMC_RING_FRAMES][CAPTOUCH_FRAME_WORDS];
+static volatile unsigned int hmc_ring_wr = 0;
+static volatile unsigned int hmc_ring_rd = 0;
+static unsigned int hmc_ring_word = 0;        // Next word of the frame being received
+static unsigned int hmc_ring_discard = 0;     // Frame being received is dropped (ring full)
+static volatile unsigned int hmc_ring_dropped = 0;
+#endif
+
+/* Interrupt once HMC_COALESCE_FRAMES whole frames are in the FIFO (or HMC_COALESCE_TIMEOUT cycles
+ * after the first of them) : the event is acknowledged before draining, so frames completed once
+ * the FIFO is seen empty raise a new interrupt. */
 void hmc_isr(void) {
-    printf("Interrupt works!\n");
     int_counter++;
-    //captouch_ev_pending_write(CAPTOUCH_INTERRUPT);  // Clear interrupt?
+    captouch_ev_pending_write(HMC_EV_DONE);
+#ifndef CSR_CAPTOUCH_DMA_BASE
+    while((captouch_status_read() & (1<<CSR_CAPTOUCH_STATUS_FIFO_EMPTY_OFFSET)) == 0 ) {
+        uint32_t data = captouch_capdata_read();
+        if(hmc_ring_word == 0)
+            hmc_ring_discard = ((hmc_ring_wr + 1) % HMC_RING_FRAMES) == hmc_ring_rd;
+        if(!hmc_ring_discard)
+            hmc_ring[hmc_ring_wr][hmc_ring_word] = data;
+        if(++hmc_ring_word == CAPTOUCH_FRAME_WORDS) {
+            hmc_ring_word = 0;
+            if(hmc_ring_discard)
+                hmc_ring_dropped++;
+            else
+                hmc_ring_wr = (hmc_ring_wr + 1) % HMC_RING_FRAMES;
+        }
+    }
+#endif
+}
+
+#ifndef CSR_CAPTOUCH_DMA_BASE
+/* Copy the oldest complete frame (CAPTOUCH_FRAME_WORDS samples) into frame.
+ * Returns 1, or 0 without waiting if no frame is available. */
+int hmc_get_frame(uint32_t *frame) {
+    unsigned int i;
+    unsigned int rd = hmc_ring_rd;
+    if(rd == hmc_ring_wr)
+        return 0;
+    for(i = 0; i < CAPTOUCH_FRAME_WORDS; i++)
+        frame[i] = hmc_ring[rd][i];
+    hmc_ring_rd = (rd + 1) % HMC_RING_FRAMES;   // Slot can be reused by the ISR
+    return 1;
+}
+
+/* Frames dropped because the ring was full */
+unsigned int hmc_frames_dropped(void) {
+    return hmc_ring_dropped;
+}
+
+/* Binary frame streaming over the UART (decoded by hmc_receiver.py), little endian :
+ *   magic 0xa5 0x5a, sequence (u16), timestamp (u32, sys_clk cycles), lines (u8), columns (u8),
+ *   lines*columns samples (u16, saturated, index = col*lines + line), CRC-16/CCITT (u16)
+ * The CRC (poly 0x1021, init 0xffff) covers everything after the magic.
+ * The sequence number also counts the frames dropped (ring full or hardware), so the host sees
+ * the gaps. */
+static uint16_t hmc_crc16(uint16_t crc, uint8_t c) {
+    int i;
+    crc ^= (uint16_t)c << 8;
+    for(i = 0; i < 8; i++)
+        crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    return crc;
+}
+
+static uint16_t hmc_put(uint16_t crc, uint32_t value, int bytes) {
+    while(bytes--) {
+        uart_write(value & 0xff);
+        crc = hmc_crc16(crc, value & 0xff);
+        value >>= 8;
+    }
+    return crc;
+}
+
+static void hmc_send_frame(uint16_t seq, uint32_t *frame) {
+    uint16_t crc = 0xffff;
+    uint32_t timestamp = 0;
+    int i;
+#ifdef CSR_TIMER0_UPTIME_CYCLES_ADDR
+    timer0_uptime_latch_write(1);
+    timestamp = (uint32_t)timer0_uptime_cycles_read();
+#endif
+    uart_write(0xa5);
+    uart_write(0x5a);
+    crc = hmc_put(crc, seq, 2);
+    crc = hmc_put(crc, timestamp, 4);
+    crc = hmc_put(crc, CAPTOUCH_NUM_LINES, 1);
+    crc = hmc_put(crc, CAPTOUCH_FRAME_WORDS/CAPTOUCH_NUM_LINES, 1);
+    for(i = 0; i < CAPTOUCH_FRAME_WORDS; i++)
+        crc = hmc_put(crc, frame[i] > 0xffff ? 0xffff : frame[i], 2);
+    hmc_put(0, crc, 2);
 }
 
+/* Stream count frames (0 : until a key is pressed), in auto mode at HMC_STREAM_FPS frames per second.
+ * A frame takes about 44 bytes (4x4 panel) : 115200 bauds carry up to ~260 frames per second, frames the
+ * link cannot keep up with are dropped by the gateware (one per period) and show up in the sequence. */
+#define HMC_STREAM_FPS 100
+void hmc_stream(unsigned int count) {
+    uint32_t frame[CAPTOUCH_FRAME_WORDS];
+    uint32_t config = captouch_config_read();
+    uint32_t period = captouch_period_read();
+    unsigned int sent = 0;
+    unsigned int dropped = hmc_frames_dropped();
+    uint16_t hw_dropped = captouch_dropped_read();
+    uint16_t seq = 0;
+    captouch_period_write(CONFIG_CLOCK_FREQUENCY/HMC_STREAM_FPS);
+    captouch_config_write(config | (1 << CSR_CAPTOUCH_CONFIG_AUTO_OFFSET));
+    captouch_ctrl_write(1);
+    while(count == 0 || sent < count) {
+        if(readchar_nonblock()) {
+            getchar();
+            break;
+        }
+        if(!hmc_get_frame(frame))
+            continue;
+        seq += (hmc_frames_dropped() - dropped) + (uint16_t)(captouch_dropped_read() - hw_dropped);
+        dropped = hmc_frames_dropped();
+        hw_dropped = captouch_dropped_read();
+        hmc_send_frame(seq++, frame);
+        sent++;
+    }
+    captouch_config_write(config);
+    captouch_period_write(period);
+    while(hmc_get_frame(frame));    // Flush the ring
+}
+#endif
+
 void hmc_init(void);
 void hmc_init(void) {
+    captouch_coalesce_write(HMC_COALESCE_FRAMES);
+    captouch_coalesce_timeout_write(HMC_COALESCE_TIMEOUT);
+#ifdef CSR_CAPTOUCH_FILTER_CTRL_ADDR
+    captouch_filter_ctrl_write((HMC_FILTER_SPIKE << CSR_CAPTOUCH_FILTER_CTRL_SPIKE_OFFSET) |
+        (HMC_FILTER_SHIFT << CSR_CAPTOUCH_FILTER_CTRL_SHIFT_OFFSET));
+#endif
+#ifdef CSR_CAPTOUCH_DMA_BASE
+    hmc_dma_init();     // Frames go to the RAM ring instead of capdata
+#endif
     captouch_ev_pending_write(captouch_ev_pending_read());
-    captouch_ev_enable_write(CAPTOUCH_INTERRUPT);
+    captouch_ev_enable_write(HMC_EV_DONE);
 
     printf("Initializing HMC interrupts...\n");
 
@@ -30,11 +173,65 @@ void hmc_init(void) {
         printf("No IRQ!\n");
     irq_setmask(irq_getmask() | (1 << CAPTOUCH_INTERRUPT ));
 }
+#ifdef CSR_CAPTOUCH_DMA_BASE
+/* Frames written by the gateware into a ring buffer in RAM, one per slot of HMC_DMA_SLOT_WORDS words
+ * (frames of this target are at most CAPTOUCH_FRAME_WORDS words, shorter ones leave the end of their slot) */
+#define HMC_DMA_FRAMES 8
+#define HMC_DMA_SLOT_WORDS CAPTOUCH_FRAME_WORDS
+static uint32_t hmc_dma_ring[HMC_DMA_FRAMES*HMC_DMA_SLOT_WORDS];
+static unsigned int hmc_dma_rd = 0;
+
+void hmc_dma_init(void) {
+    captouch_dma_ctrl_write(0);     // Ring restarts at slot 0
+    captouch_dma_base_write((uint32_t)hmc_dma_ring);
+    captouch_dma_frames_write(HMC_DMA_FRAMES);
+    captouch_dma_slot_write(HMC_DMA_SLOT_WORDS);
+    hmc_dma_rd = 0;
+    captouch_dma_ctrl_write(1);
+}
+
+/* Oldest frame not read yet (CAPTOUCH_FRAME_WORDS samples), NULL if none */
+uint32_t *hmc_dma_frame(void) {
+    uint32_t *frame;
+    if(hmc_dma_rd == captouch_dma_index_read())
+        return NULL;
+    flush_cpu_dcache();     // Written by the DMA, not through the cache
+    frame = &hmc_dma_ring[hmc_dma_rd*HMC_DMA_SLOT_WORDS];
+    hmc_dma_rd = (hmc_dma_rd + 1) % HMC_DMA_FRAMES;
+    return frame;
+}
+#endif
+
+#ifdef CSR_CAPTOUCH_PERF_CTRL_ADDR
+/* Snapshot of the performance counters, cleared afterwards if clear is set */
+void hmc_perf(int clear) {
+    unsigned int i;
+    captouch_perf_ctrl_write(1 << CSR_CAPTOUCH_PERF_CTRL_SNAPSHOT_OFFSET);
+    printf("RUN cycles (last frame) : %ld\n", captouch_perf_run_cycles_read());
+    printf("RUN cycles (max) : %ld\n", captouch_perf_run_cycles_max_read());
+    printf("Frames : %ld\n", captouch_perf_frames_read());
+    printf("Dropped frames : %ld\n", captouch_perf_dropped_frames_read());
+    printf("FIFO high-water mark : %ld\n", captouch_perf_fifo_max_read());
+    for(i = 0; i < CAPTOUCH_NUM_LINES; i++)  // One CSR per line
+        printf("Timeouts line %d : %ld\n", i,
+            csr_read_simple(CSR_CAPTOUCH_PERF_TIMEOUTS0_ADDR + i*CONFIG_CSR_ALIGNMENT/8));
+    if(clear)
+        captouch_perf_ctrl_write(1 << CSR_CAPTOUCH_PERF_CTRL_CLEAR_OFFSET);
+}
+#endif
+
 void dump_registers(void);
 void dump_registers(void) {
     printf("Data : 0x%08lx\n", captouch_capdata_read());
     printf("Status : 0x%08lx\n", captouch_status_read());
     printf("Ctrl : 0x%08lx\n", captouch_ctrl_read());
+    printf("Config : 0x%08lx\n", captouch_config_read());
+    printf("Period : %ld\n", captouch_period_read());
+    printf("Timeout : %ld\n", captouch_timeout_read());
+#ifdef CSR_CAPTOUCH_BASELINE_TOUCHED_ADDR
+    printf("Touched : 0x%08lx\n", (unsigned long)captouch_baseline_touched_read());
+#endif
+    printf("Dropped frames : %ld\n", captouch_dropped_read());
     printf("ev_status : 0x%08lx\n", captouch_ev_status_read());
     printf("ev_pending: 0x%08lx\n", captouch_ev_pending_read());
     printf("ev_enable: 0x%08lx\n", captouch_ev_enable_read());
@@ -44,12 +241,26 @@ void dump_registers(void) {
 }
 void read_capture(void);
 void read_capture(void){
+#ifndef CSR_CAPTOUCH_DMA_BASE
+    uint32_t frame[CAPTOUCH_FRAME_WORDS];
+    int i;
     printf("Interrupts counter : %d\n", int_counter);
+    while(hmc_get_frame(frame));    // Older frames
     captouch_ctrl_write(1);
-    while(captouch_ev_status_read() == 0);  // Wait for event
-    while((captouch_status_read() & (1<<CSR_CAPTOUCH_STATUS_FIFO_EMPTY_OFFSET)) == 0 ) { // While FIFO not empty
-        printf("Data : 0x%08lx\n", captouch_capdata_read());
-    }
+    while(!hmc_get_frame(frame));   // Filled by the ISR
+    for(i = 0; i < CAPTOUCH_FRAME_WORDS; i++)
+        printf("Data : 0x%08lx\n", frame[i]);
+    printf("Dropped frames (ring) : %d\n", hmc_frames_dropped());
+#else
+    uint32_t *frame;
+    int i;
+    printf("Interrupts counter : %d\n", int_counter);
+    while(hmc_dma_frame() != NULL);     // Older frames
+    captouch_ctrl_write(1);
+    while((frame = hmc_dma_frame()) == NULL);   // Written into RAM by the DMA
+    for(i = 0; i < CAPTOUCH_FRAME_WORDS; i++)
+        printf("Data : 0x%08lx\n", frame[i]);
+#endif
 }
 
 void hardmuca(void);
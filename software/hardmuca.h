@@ -1,3 +1,19 @@
+#include <stdint.h>
+
 void hmc_isr(void);
 void hmc_init(void);
 void hardmuca(void);
+#ifndef CSR_CAPTOUCH_DMA_BASE
+/* Frames buffered by the ISR */
+#define HMC_RING_FRAMES 4
+int hmc_get_frame(uint32_t *frame);
+unsigned int hmc_frames_dropped(void);
+void hmc_stream(unsigned int count);
+#endif
+#ifdef CSR_CAPTOUCH_PERF_CTRL_ADDR
+void hmc_perf(int clear);
+#endif
+#ifdef CSR_CAPTOUCH_DMA_BASE
+void hmc_dma_init(void);
+uint32_t *hmc_dma_frame(void);
+#endif
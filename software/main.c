@@ -93,6 +93,12 @@ static void help(void)
 	puts("hellocpp           - Hello C++");
 #endif
 	puts("hmc                - HardwareMutualCapacitive Test App");
+#ifndef CSR_CAPTOUCH_DMA_BASE
+	puts("hmc_stream [n]     - Stream n binary frames (0: until a key is pressed)");
+#endif
+#ifdef CSR_CAPTOUCH_PERF_CTRL_ADDR
+	puts("hmc_perf [clear]   - Dump the CapTouch performance counters");
+#endif
 }
 
 /*-----------------------------------------------------------------------*/
@@ -170,6 +176,26 @@ static void hmc_cmd(void)
 	hardmuca();
 }
 
+#ifndef CSR_CAPTOUCH_DMA_BASE
+static void hmc_stream_cmd(char *str)
+{
+	char *count;
+
+	count = get_token(&str);
+	hmc_stream(strtoul(count, NULL, 0));
+}
+#endif
+
+#ifdef CSR_CAPTOUCH_PERF_CTRL_ADDR
+static void hmc_perf_cmd(char *str)
+{
+	char *clear;
+
+	clear = get_token(&str);
+	hmc_perf(strcmp(clear, "clear") == 0);
+}
+#endif
+
 /*-----------------------------------------------------------------------*/
 /* Console service / Main                                                */
 /*-----------------------------------------------------------------------*/
@@ -200,6 +226,14 @@ static void console_service(void)
 #endif
 	else if(strcmp(token, "hmc") == 0)
 		hmc_cmd();
+#ifndef CSR_CAPTOUCH_DMA_BASE
+	else if(strcmp(token, "hmc_stream") == 0)
+		hmc_stream_cmd(str);
+#endif
+#ifdef CSR_CAPTOUCH_PERF_CTRL_ADDR
+	else if(strcmp(token, "hmc_perf") == 0)
+		hmc_perf_cmd(str);
+#endif
 	prompt();
 }
 
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Resource usage and Fmax of CapTouch for several panel sizes, on iCE40 (yosys + nextpnr-ice40)
+#
+# Each point is CapTouch alone behind a CSR bank (so that nothing is optimised away), lines/columns
+# tristate signals as top level ports. Both capture architectures can be compared : counter
+# registers per line (default) and edge timestamps in block RAM (timestamps=True).
+#
+# Example (Olimex iCE40HX8K board, 100 MHz target) :
+#   ./synth_mutcaptouch.py --sizes 4x4,8x8,16x8,32x8 --matrix --arch both --json synth.json
+#
+# --verilog-only only writes the Verilog files (no FPGA toolchain needed).
+
+import argparse
+import csv
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+from migen import *
+from migen.fhdl.verilog import convert
+
+from litex.soc.interconnect import csr_bus
+from litex.soc.interconnect.csr_bus import CSRBankArray
+
+from mutcaptouch import CapTouch
+
+DEVICES = {
+    # name : nextpnr-ice40 arguments
+    "hx8k": ["--hx8k", "--package", "ct256"],
+    "up5k": ["--up5k", "--package", "sg48"],
+}
+
+
+class CapTouchTop(Module):
+    def __init__(self, num_lines, num_cols, **kwargs):
+        self.submodules.captouch = CapTouch(num_lines, num_cols, **kwargs)
+        self.submodules.csrbanks = CSRBankArray(self, lambda name, memory: 0 if name == "captouch" else None,
+            data_width=32)
+        self.bus = csr_bus.Interface(data_width=32)
+        self.submodules.csrcon = csr_bus.Interconnect(self.bus, self.csrbanks.get_buses())
+        self.irq = self.captouch.ev.irq
+        c = self.captouch
+        self.ios = {self.bus.adr, self.bus.we, self.bus.dat_w, self.bus.dat_r, self.irq,
+            c.lines_oe, c.lines_o, c.lines_i, c.cols_oe, c.cols_o, c.cols_i}
+
+
+def run(cmd, cwd):
+    subprocess.run(cmd, cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+
+
+def synth(num_lines, num_cols, matrix, timestamps, device="hx8k", freq=100, max_timeout=2**16-1,
+          build_dir="build/synth", verilog_only=False):
+    name = "captouch_{}x{}{}_{}".format(num_lines, num_cols, "m" if matrix else "", "ts" if timestamps else "reg")
+    path = os.path.join(build_dir, name)
+    os.makedirs(path, exist_ok=True)
+    top = CapTouchTop(num_lines, num_cols, matrix=matrix, max_timeout=max_timeout, timestamps=timestamps)
+    convert(top, ios=top.ios, name="top").write(os.path.join(path, "top.v"))
+    point = {
+        "num_lines": num_lines,
+        "num_cols": num_cols,
+        "matrix": matrix,
+        "arch": "timestamps" if timestamps else "registers",
+        "device": device,
+    }
+    if verilog_only:
+        return point
+
+    run(["yosys", "-q", "-p", "synth_ice40 -top top -json top.json", "top.v"], path)
+    # Fails when the design does not fit or the IOs are short (up5k) : reported without Fmax
+    try:
+        run(["nextpnr-ice40"] + DEVICES[device] + ["--json", "top.json", "--freq", str(freq),
+            "--report", "report.json", "--pcf-allow-unconstrained"], path)
+    except subprocess.CalledProcessError:
+        point["error"] = "place and route failed"
+        return point
+    with open(os.path.join(path, "report.json")) as f:
+        report = json.load(f)
+    for cell, key in [("ICESTORM_LC", "luts"), ("ICESTORM_RAM", "brams"), ("SB_IO", "ios")]:
+        used = report["utilization"].get(cell, {"used": 0, "available": 0})
+        point[key] = used["used"]
+        point[key + "_available"] = used["available"]
+    point["fmax_mhz"] = min(clk["achieved"] for clk in report["fmax"].values())
+    point["meets_timing"] = point["fmax_mhz"] >= freq
+    return point
+
+
+def size(s):
+    lines, cols = s.lower().split("x")
+    return int(lines), int(cols)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CapTouch resource usage and Fmax on iCE40")
+    parser.add_argument("--sizes",        default="4x4,8x8,16x8,32x8",   help="Comma separated LINESxCOLS list")
+    parser.add_argument("--matrix",       action="store_true",           help="Matrix mode (one scan per column)")
+    parser.add_argument("--arch",         default="both",                help="registers, timestamps or both")
+    parser.add_argument("--device",       default="hx8k",                help="iCE40 device ({})".format(", ".join(DEVICES)))
+    parser.add_argument("--freq",         default=100, type=float,       help="Target frequency (MHz)")
+    parser.add_argument("--max-timeout",  default=2**16-1, type=int,     help="CapTouch max_timeout")
+    parser.add_argument("--build-dir",    default="build/synth",         help="Build directory")
+    parser.add_argument("--verilog-only", action="store_true",           help="Only generate the Verilog")
+    parser.add_argument("--json",         default=None,                  help="Write the results as JSON to this file")
+    parser.add_argument("--csv",          default=None,                  help="Write the results as CSV to this file")
+    args = parser.parse_args()
+
+    if not args.verilog_only:
+        for tool in ["yosys", "nextpnr-ice40"]:
+            if shutil.which(tool) is None:
+                print("{} not found (or use --verilog-only)".format(tool))
+                return 1
+
+    archs = {"registers": [False], "timestamps": [True], "both": [False, True]}[args.arch]
+    results = []
+    for s in args.sizes.split(","):
+        num_lines, num_cols = size(s)
+        for timestamps in archs:
+            point = synth(num_lines, num_cols, args.matrix, timestamps, args.device, args.freq,
+                          args.max_timeout, args.build_dir, args.verilog_only)
+            results.append(point)
+            if "error" in point:
+                print("{:>3}x{:<3} {:<10} {}".format(num_lines, num_cols, point["arch"], point["error"]))
+            elif "luts" in point:
+                print("{:>3}x{:<3} {:<10} {:>5}/{} LCs  {:>2}/{} BRAMs  {:>6.1f} MHz{}".format(
+                    num_lines, num_cols, point["arch"], point["luts"], point["luts_available"],
+                    point["brams"], point["brams_available"], point["fmax_mhz"],
+                    "" if point["meets_timing"] else "  (< {:g} MHz)".format(args.freq)))
+            else:
+                print("{:>3}x{:<3} {:<10} verilog written".format(num_lines, num_cols, point["arch"]))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.csv:
+        keys = []
+        for point in results:
+            keys += [k for k in point if k not in keys]
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=keys)
+            writer.writeheader()
+            writer.writerows(results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+
+from flash_image import ImageError, build_image, flash_image
+
+class FakeProgrammer:
+    def __init__(self):
+        self.flashed = []
+
+    def flash(self, address, filename):
+        with open(filename, "rb") as f:
+            self.flashed.append((address, f.read()))
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+def test_flash_image():
+    with tempfile.TemporaryDirectory() as d:
+        bitstream = os.path.join(d, "gateware.bin")
+        app = os.path.join(d, "app.bin")
+        image = os.path.join(d, "image.bin")
+        regions = [(0x0, 0x100, bitstream), (0x100, 0x40, app)]
+        write(bitstream, b"\x01"*0x80)
+        write(app, b"\x02"*0x10)
+
+        # Padded layout
+        data = build_image(regions)
+        assert data == b"\x01"*0x80 + b"\xff"*0x80 + b"\x02"*0x10 + b"\xff"*0x30
+
+        # First flash is a full one, then nothing, then only the app
+        prog = FakeProgrammer()
+        flash_image(prog, regions, image)
+        assert prog.flashed == [(0x0, data)]
+        flash_image(prog, regions, image)
+        assert len(prog.flashed) == 1
+        write(app, b"\x03"*0x20)
+        flash_image(prog, regions, image)
+        assert prog.flashed[1] == (0x100, b"\x03"*0x20 + b"\xff"*0x20)
+        flash_image(prog, regions, image, full=True)
+        assert prog.flashed[2][0] == 0x0 and len(prog.flashed[2][1]) == 0x140
+
+        # Interrupted flash : cached image removed, the next flash is a full one
+        class InterruptedProgrammer(FakeProgrammer):
+            def flash(self, address, filename):
+                raise KeyboardInterrupt
+        write(app, b"\x05"*0x20)
+        try:
+            flash_image(InterruptedProgrammer(), regions, image)
+            assert False
+        except KeyboardInterrupt:
+            pass
+        assert not os.path.exists(image)
+        flash_image(prog, regions, image)
+        assert prog.flashed[3][0] == 0x0 and len(prog.flashed[3][1]) == 0x140
+
+        # Too big for its region
+        write(app, b"\x04"*0x41)
+        try:
+            build_image(regions)
+            assert False
+        except ImageError:
+            pass
+
+if __name__ == "__main__":
+    test_flash_image()
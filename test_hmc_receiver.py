@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import tty
+
+import numpy as np
+
+from hmc_receiver import FrameReceiver, crc16, encode_frame
+
+def test_crc16():
+    assert crc16(b"123456789") == 0x29b1     # CRC-16/CCITT-FALSE check value
+
+def test_receiver():
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 2**16, size=(6, 3, 4))
+    stream = b"hmc_stream 6\r\n"    # Console echo before the packets
+    for seq, frame in enumerate(frames):
+        packet = encode_frame(seq, 1000*seq, frame)
+        if seq == 2:
+            packet = packet[:-1] + bytes([packet[-1] ^ 1])  # Bad CRC
+        if seq == 4:
+            continue                                        # Dropped by the firmware
+        stream += packet
+
+    # pty stand-in for the serial port
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    def write():
+        os.write(master, stream)
+    writer = threading.Thread(target=write)
+    writer.start()
+    receiver = FrameReceiver(os.fdopen(slave, "rb", buffering=0))
+    seqs, timestamps, received = receiver.read_frames(4)
+    writer.join()
+    os.close(master)
+
+    assert list(seqs) == [0, 1, 3, 5]
+    assert list(timestamps) == [0, 1000, 3000, 5000]
+    assert (received == frames[[0, 1, 3, 5]]).all()
+    assert receiver.crc_errors == 1
+    assert receiver.dropped == 2     # 2 (bad CRC) and 4
+    assert receiver.skipped == len(b"hmc_stream 6\r\n")
+
+if __name__ == "__main__":
+    test_crc16()
+    test_receiver()
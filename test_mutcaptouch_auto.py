@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from migen import *
+from mutcaptouch import CapTouch
+
+num_x_pads=4
+num_y_pads=4
+
+# x are lines, y are columns
+# Auto mode : frames are started by the module every "period" cycles, the CPU only reads the FIFO
+# With period 0 (frames back to back) and the FIFO full, one frame is dropped per frame duration, not per cycle
+
+delays = [3, 9, 5, 7]   # Rise time of each line, the same for every frame
+period = 40
+
+@passive
+def touch_generator(dut):
+    while True:
+        while ( yield dut.lines_oe ) != 0 :
+            yield   # wait for the lines to be released (RUN)
+        for i in range(max(delays)+1):
+            for j in range(num_x_pads):
+                if( delays[j] == i ):
+                    yield dut.lines_i[j].eq(1)      # Put line number j up
+            yield
+        while ( yield dut.lines_oe ) == 0 :
+            yield   # wait for the end of the capture
+        for i in range(num_x_pads):
+            yield dut.lines_i[i].eq(0)      # Put all lines down (needed for simulation only)
+
+def touch_checker(dut):
+    yield from dut.period.write(period)
+    yield from dut.config.write(1)  # auto mode, no more writes to ctrl
+    for i in range(5*period):       # let the FIFO overflow
+        yield
+    dropped = yield dut.dropped.status
+    print("Dropped frames : ", dropped)
+    if dropped < 3:
+        dut.errors += 1
+        print("Error : frames should have been dropped")
+
+    for frame in range(3):
+        while ( yield dut.fifo.source.valid ) == 0 :
+            yield
+        for index in range(num_x_pads):
+            while ( yield dut.fifo.source.valid ) == 0 :
+                yield
+            data = yield from dut.capdata.read()
+            yield
+            print("Data: ", data, "index : ", index)
+            # First edge is seen one cycle after the line rises
+            if data != delays[index] + 1:
+                dut.errors += 1
+                print("Error : expected : ",delays[index] + 1, "; received : ", data )
+        if ( yield dut.ctrl.storage ) != 0 :
+            dut.errors += 1
+    yield from dut.config.write(0)
+
+def test_captouch_auto():
+    dut=CapTouch(num_x_pads, num_y_pads)
+    dut.errors=0
+    generators = [
+        touch_generator(dut),
+        touch_checker(dut)
+    ]
+    run_simulation(dut, generators)
+    if dut.errors != 0 :
+        print("Number of errors : ", dut.errors)
+    assert dut.errors == 0
+
+def drop_checker(dut, cycles):
+    yield from dut.config.write(1)  # auto mode, period 0
+    for i in range(cycles):         # FIFO full after the first frame
+        yield
+    dropped = yield dut.dropped.status
+    yield from dut.perf.ctrl.write(1)   # Snapshot
+    yield
+    perf_dropped = yield dut.perf.dropped_frames.status
+    print("Dropped frames : ", dropped, " (perf : ", perf_dropped, ")")
+    # A frame lasts more than the slowest line
+    if dropped == 0 or dropped > cycles//(max(delays) + 1):
+        dut.errors += 1
+        print("Error : dropped frames should be counted once per frame")
+    if perf_dropped != dropped:
+        dut.errors += 1
+    yield from dut.config.write(0)
+
+def test_captouch_auto_period0():
+    dut=CapTouch(num_x_pads, num_y_pads, with_perf=True)
+    dut.errors=0
+    run_simulation(dut, [touch_generator(dut), drop_checker(dut, 400)])
+    if dut.errors != 0 :
+        print("Number of errors : ", dut.errors)
+    assert dut.errors == 0
+
+if __name__ == "__main__":
+    test_captouch_auto()
+    test_captouch_auto_period0()
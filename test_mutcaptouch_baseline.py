@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from migen import *
+from mutcaptouch import CapTouch
+
+num_x_pads=4
+num_y_pads=4
+
+# x are lines, y are columns
+# Baseline stage : the first frame loads the baselines, then deltas and touched bitmap
+
+idle = [10, 12, 14, 16]
+touch = [10, 12, 30, 16]    # Line 2 touched
+threshold = 8
+
+def capture(dut, delays):
+    yield from dut.ctrl.write(1)
+    while ( yield dut.lines_oe ) != 0 :
+        yield   # wait for the lines to be released (RUN)
+    for i in range(max(delays)+1):
+        for j in range(num_x_pads):
+            if( delays[j] == i ):
+                yield dut.lines_i[j].eq(1)      # Put line number j up
+        yield
+    while ( yield dut.ctrl.storage ) != 0 :
+        yield   # wait for the end of the frame
+    while ( yield dut.status.fields.done ) == 0 :   # Last samples on their way to the FIFO
+        yield
+    for i in range(num_x_pads):
+        yield dut.lines_i[i].eq(0)      # Put all lines down (needed for simulation only)
+    for i in range(4):
+        yield   # baseline stage latency
+
+def check_fifo(dut, expected):
+    for index in range(len(expected)):
+        data = yield from dut.capdata.read()
+        yield
+        print("Data: ", data, "index : ", index)
+        if data != expected[index]:
+            dut.errors += 1
+            print("Error : expected : ", expected[index], "; received : ", data )
+    if ( yield dut.fifo.source.valid ) != 0 :
+        dut.errors += 1
+        print("Error : FIFO should be empty")
+
+def check(dut, name, value, expected):
+    print(name, " : ", value)
+    if value != expected:
+        dut.errors += 1
+        print("Error : ", name, " expected : ", expected, "; received : ", value)
+
+def touch_checker(dut):
+    yield from dut.baseline.threshold.write(threshold)
+    yield from dut.baseline.ctrl.write(0b010)   # deltas
+    yield from capture(dut, idle)               # loads the baselines
+    yield from check_fifo(dut, [0, 0, 0, 0])
+    yield from capture(dut, touch)
+    yield from check_fifo(dut, [0, 0, 30-14, 0])
+    check(dut, "touched", (yield dut.baseline.touched.status), 0b0100)
+
+    yield from dut.baseline.ctrl.write(0b110)   # detection only
+    yield dut.ev.pending.r.eq(1)                # clear the IRQ
+    yield dut.ev.pending.re.eq(1)
+    yield
+    yield dut.ev.pending.re.eq(0)
+    yield
+    yield from capture(dut, touch)              # no change : no IRQ, nothing in the FIFO
+    check(dut, "pending", (yield dut.ev.captouch_done.pending), 0)
+    check(dut, "fifo_empty", (yield dut.status.fields.fifo_empty), 1)
+    yield from capture(dut, idle)               # released
+    check(dut, "pending", (yield dut.ev.captouch_done.pending), 1)
+    check(dut, "touched", (yield dut.baseline.touched.status), 0)
+
+def test_captouch_baseline():
+    dut=CapTouch(num_x_pads, num_y_pads, with_baseline=True, baseline_shift=2)
+    dut.errors=0
+    run_simulation(dut, touch_checker(dut))
+    if dut.errors != 0 :
+        print("Number of errors : ", dut.errors)
+    assert dut.errors == 0
+
+# Deltas beyond the signed sample range saturate (8 bits samples : 180 -> 127), the touch list keeps them
+far = [10, 12, 14+180, 16]
+sat_threshold = 100
+
+def saturation_checker(dut):
+    yield from dut.baseline.threshold.write(threshold)
+    yield from dut.baseline.ctrl.write(0b010)   # deltas
+    yield from capture(dut, idle)
+    yield from check_fifo(dut, [0, 0, 0, 0])
+    yield from capture(dut, far)
+    yield from check_fifo(dut, [0, 0, 127, 0])
+
+    yield from dut.touches.threshold.write(sat_threshold)
+    yield from dut.touches.ctrl.write(1)
+    yield from capture(dut, far)
+    while ( yield dut.fifo.source.valid ) == 0 :
+        yield   # touch list latency
+    n = yield from dut.capdata.read()
+    yield
+    check(dut, "touches", n, 1)
+    for i in range(2):
+        yield from dut.capdata.read()   # x, y
+        yield
+    peak = yield from dut.capdata.read()
+    yield
+    check(dut, "peak", peak, 127)
+
+def test_captouch_baseline_saturation():
+    dut=CapTouch(num_x_pads, num_y_pads, max_timeout=255, with_baseline=True, baseline_shift=2, with_touches=True)
+    dut.errors=0
+    run_simulation(dut, saturation_checker(dut))
+    if dut.errors != 0 :
+        print("Number of errors : ", dut.errors)
+    assert dut.errors == 0
+
+if __name__ == "__main__":
+    test_captouch_baseline()
+    test_captouch_baseline_saturation()
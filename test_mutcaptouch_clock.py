@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from migen import *
+from mutcaptouch import CapTouch
+
+num_x_pads=4
+num_y_pads=2
+
+# x are lines, y are columns
+# Capture in its own clock domain, 2.5 times faster than sys : counts are in capture cycles,
+# samples cross to sys through the async FIFO (matrix mode, both capture architectures)
+
+delays = [[7, 30, 12, None], [25, 3, 18, 9]]   # Per column, in capture cycles
+timeout = 40
+
+@passive
+def touch_generator(dut):
+    while True:
+        for col in range(num_y_pads):
+            while ( yield dut.lines_oe ) != 0 :
+                yield   # wait for the lines to be released (RUN)
+            i = 0
+            while ( yield dut.lines_oe ) == 0 :
+                for j in range(num_x_pads):
+                    if delays[col][j] is not None and delays[col][j] - 1 == i :
+                        yield dut.lines_i[j].eq(1)  # Seen by the counter on the next cycle
+                i += 1
+                yield
+            for j in range(num_x_pads):
+                yield dut.lines_i[j].eq(0)
+
+def touch_checker(dut):
+    yield from dut.timeout.write(timeout)
+    for frame in range(2):
+        yield from dut.ctrl.write(1)
+        cycles = 0
+        while ( yield dut.ctrl.storage ) != 0 :
+            cycles += 1
+            yield
+        while ( yield dut.status.fields.done ) == 0 :
+            yield
+        print("Frame done in ", cycles, " sys cycles")
+        # Two captures of up to timeout capture cycles, 2.5 capture cycles per sys cycle
+        if cycles > 2*timeout/2.5 + 30:
+            dut.errors += 1
+        for col in range(num_y_pads):
+            for index in range(num_x_pads):
+                data = yield from dut.capdata.read()
+                yield
+                expected = timeout if delays[col][index] is None else delays[col][index]
+                print("Data: ", data, "col : ", col, "index : ", index)
+                if data != expected:
+                    dut.errors += 1
+                    print("Error : expected : ", expected, "; received : ", data )
+        if ( yield dut.fifo.source.valid ) != 0 :
+            dut.errors += 1
+
+def run(timestamps):
+    dut=CapTouch(num_x_pads, num_y_pads, matrix=True, max_timeout=255, timestamps=timestamps, clock_domain="capture")
+    dut.clock_domains.cd_capture = ClockDomain()
+    dut.errors=0
+    generators = {
+        "sys":     [touch_checker(dut)],
+        "capture": [touch_generator(dut)],
+    }
+    run_simulation(dut, generators, clocks={"sys": 10, "capture": 4})
+    if dut.errors != 0 :
+        print("Number of errors : ", dut.errors)
+    assert dut.errors == 0
+
+def test_captouch_clock():
+    run(timestamps=False)
+
+def test_captouch_clock_timestamps():
+    run(timestamps=True)
+
+if __name__ == "__main__":
+    test_captouch_clock()
+    test_captouch_clock_timestamps()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from migen import *
+from mutcaptouch import CapTouch
+
+num_x_pads=4
+num_y_pads=1
+
+# x are lines, y are columns
+# Frame-complete event : not pending while a frame is being written into the FIFO, then once per
+# batch of coalesce.frames frames, or coalesce_timeout cycles after the first frame of a batch
+# The event acknowledged in the very cycle a new batch fires still raises an interrupt for it
+
+delays = [6, 3, 9, 4]
+frames = 3
+timeout = 200   # Cycles (coalescing timeout)
+
+@passive
+def touch_generator(dut):
+    while True:
+        while ( yield dut.lines_oe ) != 0 :
+            yield
+        i = 0
+        while ( yield dut.lines_oe ) == 0 :
+            for j in range(num_x_pads):
+                if delays[j] - 1 == i :
+                    yield dut.lines_i[j].eq(1)
+            i += 1
+            yield
+        for j in range(num_x_pads):
+            yield dut.lines_i[j].eq(0)
+
+def check(dut, name, value, expected):
+    if value != expected:
+        dut.errors += 1
+        print("Error : ", name, " expected : ", expected, "; received : ", value)
+
+def clear_irq(dut):
+    yield dut.ev.pending.r.eq(1)
+    yield dut.ev.pending.re.eq(1)
+    yield
+    yield dut.ev.pending.re.eq(0)
+    yield
+
+def capture(dut, pending):
+    level = yield dut.fifo.level
+    yield from dut.ctrl.write(1)
+    while ( yield dut.fifo.level ) == level :
+        yield
+    # First sample in the FIFO, frame not complete yet
+    check(dut, "pending (first sample)", (yield dut.ev.captouch_done.pending), 0)
+    while ( yield dut.ctrl.storage ) != 0 :
+        yield
+    while ( yield dut.status.fields.done ) == 0 :
+        yield
+    for i in range(4):  # Batch count, then event
+        yield
+    check(dut, "pending", (yield dut.ev.captouch_done.pending), pending)
+
+def touch_checker(dut):
+    # Batches of 3 frames
+    yield from dut.coalesce.write(frames)
+    for batch in range(2):
+        for frame in range(frames):
+            yield from capture(dut, int(frame == frames - 1))
+        check(dut, "frames", (yield dut.frames.status), frames)
+        for index in range(frames*num_x_pads):
+            data = yield from dut.capdata.read()
+            yield
+            check(dut, "data", data, delays[index % num_x_pads])
+        check(dut, "frames", (yield dut.frames.status), 0)
+        yield from clear_irq(dut)
+        check(dut, "pending (cleared)", (yield dut.ev.captouch_done.pending), 0)
+
+    # Batch not complete : fires after the timeout
+    yield from dut.coalesce_timeout.write(timeout)
+    yield from capture(dut, 0)
+    cycles = 0
+    while ( yield dut.ev.captouch_done.pending ) == 0 :
+        cycles += 1
+        yield
+    print("Event ", cycles, " cycles after the frame")
+    if cycles > timeout:
+        dut.errors += 1
+    check(dut, "frames", (yield dut.frames.status), 1)
+
+def test_captouch_coalesce():
+    dut=CapTouch(num_x_pads, num_y_pads, max_timeout=255, fifo_frames=frames)
+    dut.errors=0
+    run_simulation(dut, [touch_generator(dut), touch_checker(dut)])
+    if dut.errors != 0 :
+        print("Number of errors : ", dut.errors)
+    assert dut.errors == 0
+
+def ack_checker(dut):
+    # The previous event is still pending when the next frame starts, acknowledged d cycles later
+    for d in range(60):
+        yield from dut.ctrl.write(1)
+        for i in range(d):
+            yield
+        yield from clear_irq(dut)
+        while ( yield dut.ctrl.storage ) != 0 :
+            yield
+        while ( yield dut.status.fields.done ) == 0 :
+            yield
+        for i in range(4):
+            yield
+        while ( yield dut.fifo.source.valid ) != 0 :
+            yield from dut.capdata.read()
+            yield
+        if ( yield dut.ev.captouch_done.pending ) == 0 :
+            # The batch fired before the ack : next frame
+            yield from dut.ctrl.write(1)
+            while ( yield dut.ctrl.storage ) != 0 :
+                yield
+            while ( yield dut.status.fields.done ) == 0 :
+                yield
+            for i in range(4):
+                yield
+            while ( yield dut.fifo.source.valid ) != 0 :
+                yield from dut.capdata.read()
+                yield
+        check(dut, "pending (ack {} cycles after the start)".format(d), (yield dut.ev.captouch_done.pending), 1)
+
+def test_captouch_coalesce_ack():
+    dut=CapTouch(num_x_pads, num_y_pads, max_timeout=255)
+    dut.errors=0
+    run_simulation(dut, [touch_generator(dut), ack_checker(dut)])
+    if dut.errors != 0 :
+        print("Number of errors : ", dut.errors)
+    assert dut.errors == 0
+
+if __name__ == "__main__":
+    test_captouch_coalesce()
+    test_captouch_coalesce_ack()
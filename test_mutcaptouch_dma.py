@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from migen import *
+import random
+from litex.soc.interconnect import wishbone
+from mutcaptouch import CapTouch
+
+num_x_pads=4
+num_y_pads=2
+
+base = 0x40     # Ring buffer address (bytes)
+frames = 2      # Ring buffer size (frames)
+
+# x are lines, y are columns
+# DMA : frames written into a RAM ring buffer, one IRQ per frame
+# Packed frames (four 8-bit samples per word) are shorter than a slot : each one starts at its slot
+
+class DUT(Module):
+    def __init__(self, **kwargs):
+        self.submodules.captouch = CapTouch(num_x_pads, num_y_pads, matrix=True, with_dma=True, **kwargs)
+        self.submodules.ram = wishbone.SRAM(256, bus=self.captouch.dma.bus)
+
+def capture(dut, delays):
+    yield from dut.ctrl.write(1)
+    for col in range(num_y_pads):
+        while ( yield dut.lines_oe ) != 0 :
+            yield   # wait for the lines to be released (RUN)
+        base = col*num_x_pads
+        for i in range(max(delays[base:base+num_x_pads])+1):
+            for j in range(num_x_pads):
+                if( delays[base+j] == i ):
+                    yield dut.lines_i[j].eq(1)      # Put line number j up
+            yield
+        while ( yield dut.lines_oe ) == 0 :
+            yield   # wait for the end of the capture of this column
+        for i in range(num_x_pads):
+            yield dut.lines_i[i].eq(0)      # Put all lines down (needed for simulation only)
+
+def touch_checker(top, datas):
+    dut = top.captouch
+    frame_words = num_x_pads*num_y_pads
+    yield from dut.dma.base.write(base)
+    yield from dut.dma.frames.write(frames)
+    yield from dut.dma.ctrl.write(1)
+    for frame in range(len(datas)//frame_words):
+        yield from capture(dut, datas[frame*frame_words:(frame+1)*frame_words])
+        while ( yield dut.ev.captouch_done.pending ) == 0 :
+            yield   # one IRQ per frame
+        yield dut.ev.pending.r.eq(1)    # clear the IRQ
+        yield dut.ev.pending.re.eq(1)
+        yield
+        yield dut.ev.pending.re.eq(0)
+        yield
+        index = yield dut.dma.index.status
+        print("Frame ", frame, " written, index : ", index)
+        if index != (frame + 1) % frames:
+            dut.errors += 1
+            print("Error : wrong index ", index)
+        slot = frame % frames
+        for i in range(frame_words):
+            # First edge is seen one cycle after the line rises
+            data = yield top.ram.mem[base//4 + slot*frame_words + i]
+            if data != datas[frame*frame_words + i] + 1:
+                dut.errors += 1
+                print("Error : expected : ", datas[frame*frame_words + i] + 1, "; received : ", data )
+    if ( yield dut.fifo.source.valid ) != 0 :
+        dut.errors += 1
+        print("Error : FIFO should be empty")
+
+def test_captouch_dma():
+    top=DUT()
+    top.captouch.errors=0
+    prng = random.Random(17)
+    datas = [prng.randrange(6, 32) for i in range(3*num_x_pads*num_y_pads)]
+    run_simulation(top, touch_checker(top, datas))
+    if top.captouch.errors != 0 :
+        print("Number of errors : ", top.captouch.errors)
+    assert top.captouch.errors == 0
+
+def packed_checker(top, datas, slot):
+    dut = top.captouch
+    frame_words = num_x_pads*num_y_pads
+    yield from dut.config.write(2 << 2)     # Four samples per word
+    yield from dut.dma.base.write(base)
+    yield from dut.dma.frames.write(frames)
+    if slot is not None:
+        yield from dut.dma.slot.write(slot)
+    stride = frame_words if slot is None else slot  # Default : longest frame
+    yield from dut.dma.ctrl.write(1)
+    for frame in range(len(datas)//frame_words):
+        yield from capture(dut, datas[frame*frame_words:(frame+1)*frame_words])
+        while ( yield dut.status.fields.done ) == 0 :
+            yield
+        for i in range(10):     # Last word through the bus
+            yield
+        for i in range(frame_words//4):
+            data = yield top.ram.mem[base//4 + (frame % frames)*stride + i]
+            expected = sum((datas[frame*frame_words + 4*i + k] + 1) << (8*k) for k in range(4))
+            if data != expected:
+                dut.errors += 1
+                print("Error : frame ", frame, " expected : ", hex(expected), "; received : ", hex(data))
+
+def test_captouch_dma_slot():
+    prng = random.Random(18)
+    datas = [prng.randrange(6, 32) for i in range(3*num_x_pads*num_y_pads)]
+    for slot in [None, 3]:
+        top=DUT(with_packing=True)
+        top.captouch.errors=0
+        run_simulation(top, packed_checker(top, datas, slot))
+        if top.captouch.errors != 0 :
+            print("Number of errors : ", top.captouch.errors)
+        assert top.captouch.errors == 0
+
+if __name__ == "__main__":
+    test_captouch_dma()
+    test_captouch_dma_slot()
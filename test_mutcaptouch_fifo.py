@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from migen import *
+import random
+from mutcaptouch import CapTouch
+
+num_x_pads=4
+num_y_pads=3
+
+# x are lines, y are columns
+# Two frames in the FIFO before reading it, packed two (16-bit) and four (8-bit) samples per read
+# Auto mode with a reader polling at random through several processing stages : no sample lost when
+# the FIFO fills up (the room check counts every sample still in the stages)
+
+timeout = 300
+
+def capture(dut, delays):
+    yield from dut.ctrl.write(1)
+    for col in range(num_y_pads):
+        while ( yield dut.lines_oe ) != 0 :
+            yield   # wait for the lines to be released (RUN)
+        base = col*num_x_pads
+        for i in range(timeout):
+            if ( yield dut.lines_oe ) != 0 :
+                break
+            for j in range(num_x_pads):
+                if( delays[base+j] == i ):
+                    yield dut.lines_i[j].eq(1)      # Put line number j up
+            yield
+        while ( yield dut.lines_oe ) == 0 :
+            yield   # wait for the end of the capture of this column
+        for i in range(num_x_pads):
+            yield dut.lines_i[i].eq(0)      # Put all lines down (needed for simulation only)
+    while ( yield dut.status.fields.done ) == 0 :
+        yield
+
+def touch_checker(dut, datas):
+    frame_words = num_x_pads*num_y_pads
+    yield from dut.timeout.write(timeout)
+    for frame, pack in enumerate([1, 2]):
+        yield from dut.config.write(pack << 2)
+        yield from capture(dut, datas[frame*frame_words:(frame+1)*frame_words])
+    print("FIFO level : ", (yield dut.fifo.level))
+
+    for frame, bits in enumerate([16, 8]):
+        # First edge is seen one cycle after the line rises, line 1 never goes up
+        expected = [timeout if d is None else d + 1 for d in datas[frame*frame_words:(frame+1)*frame_words]]
+        expected = [min(e, 2**bits-1) for e in expected]
+        per_word = 32//bits
+        for index in range(frame_words//per_word):
+            data = yield from dut.capdata.read()
+            yield
+            print("Data: ", hex(data), "index : ", index)
+            for k in range(per_word):
+                value = (data >> (k*bits)) & (2**bits-1)
+                if value != expected[index*per_word + k]:
+                    dut.errors += 1
+                    print("Error : expected : ", expected[index*per_word + k], "; received : ", value )
+    if ( yield dut.fifo.source.valid ) != 0 :
+        dut.errors += 1
+        print("Error : FIFO should be empty")
+
+def test_captouch_fifo():
+    dut=CapTouch(num_x_pads, num_y_pads, matrix=True, max_timeout=1023, fifo_frames=2, with_packing=True)
+    dut.errors=0
+    prng = random.Random(17)
+    datas = [prng.randrange(6, 32) for i in range(2*num_x_pads*num_y_pads)]
+    datas[1] = datas[13] = None
+    run_simulation(dut, touch_checker(dut, datas))
+    if dut.errors != 0 :
+        print("Number of errors : ", dut.errors)
+    assert dut.errors == 0
+
+stage_delays = [9, 4, 12, 7]
+
+@passive
+def stage_generator(dut):
+    while True:
+        while ( yield dut.lines_oe ) != 0 :
+            yield
+        i = 0
+        while ( yield dut.lines_oe ) == 0 :
+            for j in range(len(stage_delays)):
+                if stage_delays[j] - 1 == i :
+                    yield dut.lines_i[j].eq(1)
+            i += 1
+            yield
+        for j in range(len(stage_delays)):
+            yield dut.lines_i[j].eq(0)
+
+def stage_reader(dut, cycles):
+    prng = random.Random(5)
+    yield from dut.timeout.write(40)
+    yield from dut.config.write(1)      # Auto mode, back to back frames (period 0)
+    received = []
+    for i in range(cycles):
+        if prng.random() < 0.1 and ( yield dut.fifo.source.valid ):
+            received.append((yield from dut.capdata.read()))
+        yield
+    expected = stage_delays*(len(received)//len(stage_delays) + 1)
+    print("Read : ", len(received), " words")
+    if received != expected[:len(received)] or len(received) < 4*len(stage_delays):
+        dut.errors += 1
+        print("Error : expected : ", expected[:len(received)], "; received : ", received)
+
+def test_captouch_fifo_stages():
+    for kwargs in [dict(with_baseline=True, with_packing=True), dict(with_filter=True, with_packing=True),
+            dict(with_filter=True, with_baseline=True, with_packing=True)]:
+        dut=CapTouch(len(stage_delays), 1, max_timeout=255, fifo_frames=2, **kwargs)
+        dut.errors=0
+        run_simulation(dut, [stage_generator(dut), stage_reader(dut, 3000)])
+        print(kwargs, " errors : ", dut.errors)
+        assert dut.errors == 0
+
+if __name__ == "__main__":
+    test_captouch_fifo()
+    test_captouch_fifo_stages()
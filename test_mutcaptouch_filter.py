@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from mutcaptouch import CapTouch
+from mutcaptouch_model import CapTouchModel, random_rise, check, simulate
+
+# Spike rejection and IIR filter per sensor (with_filter=True) against the NumPy model, over consecutive
+# frames (the filter state is carried from frame to frame), then a single spike on steady values
+
+def test_filter_model():
+    kwargs = dict(matrix=True, max_timeout=255)
+    model = CapTouchModel(4, 2, **kwargs)
+    model.timeout = 100
+    rise = random_rise(model, 6, high=120, p_timeout=0.1, rng=31)
+    for spike, shift in [(0, 0), (1, 0), (2, 0), (0, 3), (1, 2), (2, 7)]:
+        model.spike = spike
+        model.shift = shift
+        errors = check(CapTouch(4, 2, with_filter=True, **kwargs), model, rise, samples=len(rise), rng=32)
+        print(spike, shift, errors)
+        assert errors == []
+
+def test_filter_oversampling_hadamard():
+    kwargs = dict(matrix=True, max_timeout=255, max_oversampling=2)
+    model = CapTouchModel(3, 3, hadamard=True, **kwargs)
+    model.timeout = 200
+    model.oversampling = 1
+    model.mean = True
+    model.spike = 1
+    model.shift = 1
+    rise = random_rise(model, 5, high=220, p_timeout=0.1, rng=33)
+    errors = check(CapTouch(3, 3, with_filter=True, hadamard=True, timestamps=True, **kwargs), model, rise,
+        samples=len(rise), rng=34)
+    print(errors)
+    assert errors == []
+
+def test_filter_spike():
+    # Steady values, line 1 spikes on frame 3 : rejected by both windows
+    model = CapTouchModel(4, 1, max_timeout=255)
+    model.timeout = 100
+    rise = np.tile([30, 45, 20, 60], (6, 1, 1))
+    rise[3, 0, 1] = 99
+    for spike in [1, 2]:
+        model.spike = spike
+        words, _, _ = simulate(CapTouch(4, 1, max_timeout=255, with_filter=True), model, rise)
+        print(words)
+        assert words == [[30, 45, 20, 60]]*6
+
+if __name__ == "__main__":
+    test_filter_model()
+    test_filter_oversampling_hadamard()
+    test_filter_spike()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from migen import *
+from mutcaptouch import CapTouch
+from mutcaptouch_model import CapTouchModel, random_rise, check, simulate
+
+# Hadamard drive (hadamard=True) : all the columns driven at once over 2**bits_for(num_cols) sub-scans,
+# decoded to one signed value per line and column. The Migen decoding against the NumPy model (random
+# rise times, both capture architectures, packing), then a panel whose line delays are linear in the
+# columns pattern (read from cols_o) : the decoding gives back the contribution of each column
+
+num_x_pads=4
+num_y_pads=3
+
+def test_hadamard_model():
+    kwargs = dict(matrix=True, max_timeout=255, hadamard=True)
+    model = CapTouchModel(num_x_pads, num_y_pads, **kwargs)
+    model.timeout = 100
+    rise = random_rise(model, 20, high=120, p_timeout=0.1, rng=11)
+    for timestamps in [False, True]:
+        errors = check(CapTouch(num_x_pads, num_y_pads, timestamps=timestamps, **kwargs), model, rise, samples=3, rng=12)
+        print(errors)
+        assert errors == []
+
+def test_hadamard_oversampling_packing():
+    kwargs = dict(matrix=True, max_timeout=255, max_oversampling=2, hadamard=True)
+    model = CapTouchModel(3, 2, **kwargs)
+    model.timeout = 200
+    model.oversampling = 1
+    model.pack = 2     # 8 bit signed lanes (saturated)
+    rise = random_rise(model, 10, high=250, p_timeout=0.2, rng=13)
+    errors = check(CapTouch(3, 2, with_packing=True, **kwargs), model, rise, samples=3, rng=14)
+    print(errors)
+    assert errors == []
+
+def test_hadamard_packing_16():
+    kwargs = dict(matrix=True, max_timeout=255, hadamard=True)
+    model = CapTouchModel(3, 2, **kwargs)
+    model.timeout = 200
+    model.pack = 1     # 16 bit signed lanes, wider than the samples (sign extended)
+    rise = random_rise(model, 10, high=250, p_timeout=0.2, rng=15)
+    errors = check(CapTouch(3, 2, with_packing=True, **kwargs), model, rise, samples=3, rng=16)
+    print(errors)
+    assert errors == []
+
+base = [40, 35, 50, 45]                         # Per line, in cycles
+gain = [[3, -2, 0, 5], [0, 4, -1, 2], [-3, 1, 6, 0]]     # Per column and line : delay added when driven high
+
+@passive
+def touch_generator(dut):
+    while True:
+        while ( yield dut.lines_oe ) != 0 :
+            cols = yield dut.cols_o     # Columns pattern, driven while the lines are discharged
+            yield
+        delays = [base[j] + sum(gain[c][j] if (cols >> c) & 1 else -gain[c][j] for c in range(num_y_pads))
+            for j in range(num_x_pads)]
+        i = 0
+        while ( yield dut.lines_oe ) == 0 :
+            for j in range(num_x_pads):
+                if delays[j] - 1 == i :
+                    yield dut.lines_i[j].eq(1)
+            i += 1
+            yield
+        for j in range(num_x_pads):
+            yield dut.lines_i[j].eq(0)
+
+def touch_checker(dut):
+    sw = len(dut.capdata.w)
+    yield from dut.timeout.write(100)
+    for frame in range(2):
+        yield from dut.ctrl.write(1)
+        while ( yield dut.ctrl.storage ) != 0 :
+            yield
+        while ( yield dut.status.fields.done ) == 0 :
+            yield
+        for col in range(num_y_pads):
+            for index in range(num_x_pads):
+                data = yield from dut.capdata.read()
+                yield
+                data -= (data >> (sw - 1)) << sw    # Two's complement
+                if data != gain[col][index]:
+                    dut.errors += 1
+                    print("Error : col ", col, " line ", index, " expected : ", gain[col][index], "; received : ", data)
+        if ( yield dut.fifo.source.valid ) != 0 :
+            dut.errors += 1
+
+def test_hadamard_linear():
+    dut=CapTouch(num_x_pads, num_y_pads, matrix=True, max_timeout=255, hadamard=True)
+    dut.errors=0
+    run_simulation(dut, [touch_generator(dut), touch_checker(dut)])
+    if dut.errors != 0 :
+        print("Number of errors : ", dut.errors)
+    assert dut.errors == 0
+
+if __name__ == "__main__":
+    test_hadamard_model()
+    test_hadamard_oversampling_packing()
+    test_hadamard_packing_16()
+    test_hadamard_linear()
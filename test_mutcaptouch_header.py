@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from migen import *
+from litex.soc.interconnect import wishbone
+from mutcaptouch import CapTouch
+
+num_x_pads=4
+num_y_pads=2
+
+# x are lines, y are columns
+# Frame header (timestamp, sequence) and trailer (scan duration) around the samples, through the
+# FIFO and the DMA, sequence gaps when frames are dropped (auto mode)
+
+delays = [[7, 30, 12, None], [25, 3, 18, 9]]   # Per column
+timeout = 40
+frame_words = num_x_pads*num_y_pads
+base = 0x40     # DMA ring buffer address (bytes)
+
+@passive
+def touch_generator(dut):
+    while True:
+        while ( yield dut.lines_oe ) != 0 :
+            yield   # wait for the lines to be released (RUN)
+        col = yield dut.col_id
+        i = 0
+        while ( yield dut.lines_oe ) == 0 :
+            for j in range(num_x_pads):
+                if delays[col][j] is not None and delays[col][j] - 1 == i :
+                    yield dut.lines_i[j].eq(1)
+            i += 1
+            yield
+        for j in range(num_x_pads):
+            yield dut.lines_i[j].eq(0)
+
+samples = [timeout if d is None else d for col in delays for d in col]
+
+def check_frame(dut, frame, sequence):
+    if len(frame) != frame_words + 3:
+        dut.errors += 1
+        print("Error : frame length ", len(frame))
+        return
+    if frame[1] != sequence:
+        dut.errors += 1
+        print("Error : sequence expected : ", sequence, "; received : ", frame[1])
+    if frame[2:-1] != samples:
+        dut.errors += 1
+        print("Error : expected : ", samples, "; received : ", frame[2:-1])
+
+def read_frame(dut):
+    frame = []
+    while ( yield dut.fifo.source.valid ) != 0 :
+        last = yield dut.fifo.source.last
+        frame.append((yield from dut.capdata.read()))
+        yield
+        if last:
+            break
+    return frame
+
+def header_checker(dut):
+    yield from dut.timeout.write(timeout)
+    previous = None
+    for sequence in range(3):
+        for i in range(10*sequence):
+            yield   # frames started at different times
+        yield from dut.ctrl.write(1)
+        start = yield dut.cycles.status
+        cycles = 0
+        while ( yield dut.ctrl.storage ) != 0 :
+            cycles += 1
+            yield
+        while ( yield dut.status.fields.done ) == 0 :
+            yield
+        frame = yield from read_frame(dut)
+        print("Frame : ", frame, " duration : ", cycles, " cycles")
+        check_frame(dut, frame, sequence)
+        # Timestamp of the start of the frame, one cycle after the write
+        if frame[0] != start:
+            dut.errors += 1
+            print("Error : timestamp expected : ", start, "; received : ", frame[0])
+        if abs(frame[-1] - cycles) > 2:
+            dut.errors += 1
+            print("Error : duration expected : ", cycles, "; received : ", frame[-1])
+        if previous is not None and frame[0] <= previous:
+            dut.errors += 1
+        previous = frame[0]
+
+def dropped_checker(dut):
+    # Auto mode, a frame every 100 cycles, room for a single frame in the FIFO
+    yield from dut.timeout.write(timeout)
+    yield from dut.period.write(100)
+    yield from dut.config.write(1)
+    for i in range(450):
+        yield   # FIFO full : frames dropped
+    frame = yield from read_frame(dut)
+    check_frame(dut, frame, 0)
+    while ( yield dut.frames.status ) == 0 :
+        yield   # next whole frame
+    dropped = yield dut.dropped.status
+    frame = yield from read_frame(dut)
+    print("Frame : ", frame, " dropped : ", dropped)
+    if dropped == 0:
+        dut.errors += 1
+    check_frame(dut, frame, 1 + dropped)
+
+def run(generator, **kwargs):
+    dut=CapTouch(num_x_pads, num_y_pads, matrix=True, max_timeout=255, with_header=True, **kwargs)
+    dut.errors=0
+    run_simulation(dut, [touch_generator(dut), generator(dut)])
+    if dut.errors != 0 :
+        print("Number of errors : ", dut.errors)
+    assert dut.errors == 0
+
+def test_captouch_header():
+    run(header_checker)
+
+def test_captouch_header_timestamps():
+    run(header_checker, timestamps=True)
+
+def test_captouch_header_dropped():
+    run(dropped_checker)
+
+class DUT(Module):
+    def __init__(self):
+        self.submodules.captouch = CapTouch(num_x_pads, num_y_pads, matrix=True, max_timeout=255, with_dma=True,
+            with_header=True)
+        self.submodules.ram = wishbone.SRAM(256, bus=self.captouch.dma.bus)
+
+def dma_checker(top):
+    dut = top.captouch
+    yield from dut.timeout.write(timeout)
+    yield from dut.dma.base.write(base)
+    yield from dut.dma.frames.write(2)
+    yield from dut.dma.ctrl.write(1)
+    for sequence in range(2):
+        yield from dut.ctrl.write(1)
+        while ( yield dut.ev.captouch_done.pending ) == 0 :
+            yield
+        yield dut.ev.pending.r.eq(1)    # clear the IRQ
+        yield dut.ev.pending.re.eq(1)
+        yield
+        yield dut.ev.pending.re.eq(0)
+        yield
+        # Frame slots of frame_words + 3 words
+        slot = base//4 + sequence*(frame_words + 3)
+        frame = []
+        for i in range(frame_words + 3):
+            frame.append((yield top.ram.mem[slot + i]))
+        print("Frame : ", frame)
+        check_frame(dut, frame, sequence)
+
+def test_captouch_header_dma():
+    top=DUT()
+    top.captouch.errors=0
+    run_simulation(top, [touch_generator(top.captouch), dma_checker(top)])
+    if top.captouch.errors != 0 :
+        print("Number of errors : ", top.captouch.errors)
+    assert top.captouch.errors == 0
+
+if __name__ == "__main__":
+    test_captouch_header()
+    test_captouch_header_timestamps()
+    test_captouch_header_dropped()
+    test_captouch_header_dma()
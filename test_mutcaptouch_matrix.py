@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from migen import *
+import random
+from mutcaptouch import CapTouch
+
+num_x_pads=4
+num_y_pads=3
+
+# x are lines, y are columns
+# Matrix mode : one frame is num_x_pads*num_y_pads values, column by column
+
+def touch_generator(dut, datas):
+    for frame in range(len(datas)//(num_x_pads*num_y_pads)):
+        for col in range(num_y_pads):
+            while ( yield dut.lines_oe ) != 0 :
+                cols = yield dut.cols_o     # Column driven before the lines are released
+                yield   # wait for the lines to be released (RUN)
+            if cols != 1<<col:
+                dut.errors += 1
+                print("Error : column ", col, " not driven alone : ", bin(cols))
+            base = (frame*num_y_pads + col)*num_x_pads
+            for i in range(max(datas[base:base+num_x_pads])+1):
+                for j in range(num_x_pads):
+                    if( datas[base+j] == i ):
+                        yield dut.lines_i[j].eq(1)      # Put line number j up
+                yield                                   # yield a clock tick even if no line changed state
+            while ( yield dut.lines_oe ) == 0 :
+                yield   # wait for the end of the capture of this column
+            for i in range(num_x_pads):
+                yield dut.lines_i[i].eq(0)      # Put all lines down (needed for simulation only)
+
+def touch_checker(dut, datas):
+    frame_words = num_x_pads*num_y_pads
+    for frame in range(len(datas)//frame_words):
+        yield from dut.ctrl.write(1)    # trigger a capture (a full frame)
+        while ( yield dut.ctrl.storage ) != 0 :    # Cleared after the last capture of the frame
+            yield
+        while ( yield dut.status.fields.done ) == 0 :   # Last samples on their way to the FIFO
+            yield
+        for index in range(frame_words):
+            data = yield from dut.capdata.read()
+            yield
+            print("Data: ", data, "index : ", index)
+            # First edge is seen one cycle after the line rises
+            if data != datas[index+frame*frame_words] + 1:
+                dut.errors += 1
+                print("Error : expected : ",datas[index+frame*frame_words] + 1, "; received : ", data )
+        if ( yield dut.fifo.source.valid ) != 0 :
+            dut.errors += 1
+            print("Error : FIFO not empty after a full frame")
+
+def test_captouch_matrix():
+    dut=CapTouch(num_x_pads, num_y_pads, matrix=True)
+    dut.errors=0
+    min_delay = 6
+    dut.max_delay = 32
+    prng = random.Random(17)
+    datas=[]
+    for k in range(3):
+        datas += [prng.randrange(min_delay,dut.max_delay) for i in range(num_x_pads*num_y_pads)]    # Generate the fake delays we want to measure
+    print(datas)
+    generators = [
+        touch_generator(dut, datas),
+        touch_checker(dut, datas)
+    ]
+    run_simulation(dut, generators)
+    if dut.errors != 0 :
+        print("Number of errors : ", dut.errors)
+    assert dut.errors == 0
+
+if __name__ == "__main__":
+    test_captouch_matrix()
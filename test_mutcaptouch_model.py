@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from mutcaptouch import CapTouch
+from mutcaptouch_model import CapTouchModel, random_rise, check
+
+# NumPy model against the Migen simulation, on a few sampled frames out of many
+
+def test_model_matrix():
+    model = CapTouchModel(4, 3, matrix=True, max_timeout=255)
+    model.timeout = 40
+    rise = random_rise(model, 10000, high=48, p_timeout=0.1, rng=1)
+    errors = check(CapTouch(4, 3, matrix=True, max_timeout=255), model, rise, samples=4, rng=2)
+    print(errors)
+    assert errors == []
+
+def test_model_oversampling_packing():
+    kwargs = dict(matrix=True, max_timeout=1023, max_oversampling=4)
+    model = CapTouchModel(3, 2, **kwargs)
+    model.timeout = 300
+    model.oversampling = 1
+    for mean, pack in [(False, 1), (True, 2)]:
+        model.mean = mean
+        model.pack = pack
+        rise = random_rise(model, 1000, high=400, rng=3)
+        errors = check(CapTouch(3, 2, with_packing=True, **kwargs), model, rise, samples=2, rng=4)
+        print(errors)
+        assert errors == []
+
+def test_model_timeout():
+    model = CapTouchModel(4, 4)
+    model.timeout = 20
+    rise = np.array([[[3, 25, 20, 7]]])
+    assert model.samples(rise).tolist() == [[3, 20, 20, 7]]
+
+if __name__ == "__main__":
+    test_model_timeout()
+    test_model_matrix()
+    test_model_oversampling_packing()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from migen import *
+import random
+from mutcaptouch import CapTouch
+
+num_x_pads=4
+num_y_pads=4
+oversampling=2      # 2**2 captures per sample
+
+# x are lines, y are columns
+
+def touch_generator(dut, datas):
+    for capture in range(len(datas)//num_x_pads):
+        while ( yield dut.lines_oe ) != 0 :
+            yield   # wait for the lines to be released (RUN)
+        base = capture*num_x_pads
+        for i in range(max(datas[base:base+num_x_pads])+1):
+            for j in range(num_x_pads):
+                if( datas[base+j] == i ):
+                    yield dut.lines_i[j].eq(1)      # Put line number j up
+            yield
+        while ( yield dut.lines_oe ) == 0 :
+            yield   # wait for the end of the capture
+        for i in range(num_x_pads):
+            yield dut.lines_i[i].eq(0)      # Put all lines down (needed for simulation only)
+
+def touch_checker(dut, datas, setting=oversampling):
+    n = 2**oversampling
+    yield from dut.oversampling.write(setting)
+    for frame, mean in enumerate([0, 1]):
+        yield from dut.config.write(mean << 1)
+        yield from dut.ctrl.write(1)    # n captures, one frame
+        while ( yield dut.ctrl.storage ) != 0 :
+            yield
+        while ( yield dut.status.fields.done ) == 0 :   # Last samples on their way to the FIFO
+            yield
+        for index in range(num_x_pads):
+            data = yield from dut.capdata.read()
+            yield
+            # First edge is seen one cycle after the line rises
+            expected = sum(datas[(frame*n+k)*num_x_pads+index] + 1 for k in range(n))
+            if mean:
+                expected //= n
+            print("Data: ", data, "index : ", index)
+            if data != expected:
+                dut.errors += 1
+                print("Error : expected : ", expected, "; received : ", data )
+
+def test_captouch_oversampling(setting=oversampling):
+    dut=CapTouch(num_x_pads, num_y_pads, max_oversampling=4)
+    dut.errors=0
+    prng = random.Random(17)
+    datas = [prng.randrange(6, 32) for i in range(2*(2**oversampling)*num_x_pads)]
+    generators = [
+        touch_generator(dut, datas),
+        touch_checker(dut, datas, setting)
+    ]
+    run_simulation(dut, generators)
+    if dut.errors != 0 :
+        print("Number of errors : ", dut.errors)
+    assert dut.errors == 0
+
+# A setting above log2(max_oversampling) is clamped to it
+def test_captouch_oversampling_clamp():
+    test_captouch_oversampling(3)
+
+if __name__ == "__main__":
+    test_captouch_oversampling()
+    test_captouch_oversampling_clamp()
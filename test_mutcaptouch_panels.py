@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from migen import *
+from mutcaptouch import CapTouchPanels
+
+# Two panels (3x1 and 2x2, matrix mode) started together, their frames read through one capdata
+# register, each tagged with its panel
+
+panels = [(3, 1), (2, 2)]
+delays = [
+    [[5, 12, 8]],           # Panel 0, per column
+    [[20, 4], [9, 15]],     # Panel 1
+]
+timeout = 40
+
+@passive
+def touch_generator(engine, delays):
+    while True:
+        for col in range(len(delays)):
+            while ( yield engine.lines_oe ) != 0 :
+                yield   # wait for the lines to be released (RUN)
+            i = 0
+            while ( yield engine.lines_oe ) == 0 :
+                for j in range(len(delays[col])):
+                    if delays[col][j] - 1 == i :
+                        yield engine.lines_i[j].eq(1)
+                i += 1
+                yield
+            for j in range(len(delays[col])):
+                yield engine.lines_i[j].eq(0)
+
+def touch_checker(dut):
+    for engine in dut.engines:
+        yield from engine.timeout.write(timeout)
+    for frame in range(2):
+        yield from dut.ctrl.write(1)
+        while ( yield dut.ctrl.storage ) != 0 :
+            yield
+        while ( yield dut.status.fields.done ) == 0 :
+            yield
+        received = {}
+        order = []
+        while ( yield dut.status.fields.fifo_empty ) == 0 :
+            panel = yield dut.panel.status
+            data = yield from dut.capdata.read()
+            yield
+            received.setdefault(panel, []).append(data)
+            if not order or order[-1] != panel:
+                order.append(panel)
+        print("Frame ", frame, " : ", received)
+        if sorted(order) != list(range(len(panels))):   # Whole frames, not interleaved
+            dut.errors += 1
+            print("Error : panels interleaved : ", order)
+        for panel in range(len(panels)):
+            expected = [d for col in delays[panel] for d in col]
+            if received.get(panel) != expected:
+                dut.errors += 1
+                print("Error : panel ", panel, " expected : ", expected, "; received : ", received.get(panel))
+
+def test_captouch_panels():
+    dut = CapTouchPanels(panels, matrix=True, max_timeout=255)
+    dut.errors = 0
+    generators = [touch_checker(dut)] + [touch_generator(e, d) for e, d in zip(dut.engines, delays)]
+    run_simulation(dut, generators)
+    if dut.errors != 0 :
+        print("Number of errors : ", dut.errors)
+    assert dut.errors == 0
+
+if __name__ == "__main__":
+    test_captouch_panels()
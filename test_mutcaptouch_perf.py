@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from migen import *
+from mutcaptouch import CapTouch
+
+num_x_pads=4
+num_y_pads=2
+
+# x are lines, y are columns
+# Performance counters : RUN cycles per frame, timeouts per line, FIFO high-water mark, frames
+# completed and dropped, snapshot and clear
+
+delays = [[7, None, 12, None], [25, 3, 18, 9]]   # Per column, None : timeout
+timeout = 40
+
+@passive
+def touch_generator(dut):
+    while True:
+        while ( yield dut.lines_oe ) != 0 :
+            yield   # wait for the lines to be released (RUN)
+        col = yield dut.col_id
+        i = 0
+        while ( yield dut.lines_oe ) == 0 :
+            for j in range(num_x_pads):
+                if delays[col][j] is not None and delays[col][j] - 1 == i :
+                    yield dut.lines_i[j].eq(1)
+            i += 1
+            yield
+        for j in range(num_x_pads):
+            yield dut.lines_i[j].eq(0)
+
+def check(dut, name, value, expected):
+    if value != expected:
+        dut.errors += 1
+        print("Error : ", name, " expected : ", expected, "; received : ", value)
+
+def snapshot(dut):
+    yield from dut.perf.ctrl.write(1)
+    for i in range(8):
+        yield   # through the synchroniser (capture domain)
+    counters = {}
+    for name in ["run_cycles", "run_cycles_max", "frames", "dropped_frames", "fifo_max"]:
+        counters[name] = yield getattr(dut.perf, name).status
+    counters["timeouts"] = []
+    for a in range(num_x_pads):
+        counters["timeouts"].append((yield getattr(dut.perf, "timeouts{}".format(a)).status))
+    print(counters)
+    return counters
+
+def capture(dut):
+    yield from dut.ctrl.write(1)
+    while ( yield dut.ctrl.storage ) != 0 :
+        yield
+    while ( yield dut.status.fields.done ) == 0 :
+        yield
+
+def perf_checker(dut):
+    yield from dut.timeout.write(timeout)
+    for frame in range(3):
+        yield from capture(dut)
+        while ( yield dut.fifo.source.valid ) != 0 :
+            yield from dut.capdata.read()
+            yield
+    counters = yield from snapshot(dut)
+    check(dut, "frames", counters["frames"], 3)
+    check(dut, "dropped", counters["dropped_frames"], 0)
+    check(dut, "fifo_max", counters["fifo_max"], num_x_pads*num_y_pads)
+    check(dut, "timeouts", counters["timeouts"], [3*sum(col[a] is None for col in delays) for a in range(num_x_pads)])
+    # Column 0 times out, column 1 ends with its slowest line (a cycle more to see it)
+    expected = timeout + 1 + 25 + 1
+    if abs(counters["run_cycles"] - expected) > 2:
+        dut.errors += 1
+        print("Error : run_cycles expected : ", expected, "; received : ", counters["run_cycles"])
+    check(dut, "run_cycles_max", counters["run_cycles_max"], counters["run_cycles"])
+
+    # Auto mode, FIFO not read : frames dropped
+    yield from dut.period.write(100)
+    yield from dut.config.write(1)
+    for i in range(600):
+        yield
+    yield from dut.config.write(0)
+    counters = yield from snapshot(dut)
+    check(dut, "dropped", counters["dropped_frames"], (yield dut.dropped.status))
+    if counters["dropped_frames"] == 0:
+        dut.errors += 1
+
+    # Clear : counters from 0, the snapshot keeps its values until the next one
+    yield from dut.perf.ctrl.write(2)
+    check(dut, "frames (not snapshot)", (yield dut.perf.frames.status), counters["frames"])
+    counters = yield from snapshot(dut)
+    check(dut, "frames", counters["frames"], 0)
+    check(dut, "timeouts", counters["timeouts"], [0]*num_x_pads)
+    check(dut, "run_cycles_max", counters["run_cycles_max"], 0)
+
+def run(**kwargs):
+    dut=CapTouch(num_x_pads, num_y_pads, matrix=True, max_timeout=255, with_perf=True, **kwargs)
+    dut.errors=0
+    if "clock_domain" in kwargs:
+        dut.clock_domains.cd_capture = ClockDomain()
+        generators = {"sys": [perf_checker(dut)], "capture": [touch_generator(dut)]}
+        run_simulation(dut, generators, clocks={"sys": 10, "capture": 4})
+    else:
+        run_simulation(dut, [touch_generator(dut), perf_checker(dut)])
+    if dut.errors != 0 :
+        print("Number of errors : ", dut.errors)
+    assert dut.errors == 0
+
+def test_captouch_perf():
+    run()
+
+def test_captouch_perf_timestamps():
+    run(timestamps=True)
+
+def test_captouch_perf_clock():
+    run(clock_domain="capture")
+
+if __name__ == "__main__":
+    test_captouch_perf()
+    test_captouch_perf_timestamps()
+    test_captouch_perf_clock()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from migen import *
+from mutcaptouch import CapTouch
+
+num_x_pads=4
+num_y_pads=3
+
+# x are lines, y are columns
+# Self-capacitance pre-scan : lines and columns are timed together, the mutual scan only runs
+# (and the frame is only sent) when one of them is still low after the threshold
+
+delays = [[7, 30, 12, 5], [25, 3, 18, 9], [4, 11, 6, 22]]     # Mutual scan, per column
+idle_lines, idle_cols = [6, 8, 5, 9], [7, 4, 10]            # Pre-scan, no touch
+touch_lines, touch_cols = [6, 8, 35, 9], [7, 33, 10]        # Pre-scan, touch near line 2/column 1
+timeout = 60
+threshold = 20
+touched = [False, True, False, False, True]
+
+@passive
+def touch_generator(dut, state):
+    while True:
+        cols = 0
+        while ( yield dut.lines_oe ) != 0 :
+            cols = yield dut.cols_o     # 0 : pre-scan discharge, the driven column otherwise
+            yield
+        if cols == 0:
+            lines_delays, cols_delays = (touch_lines, touch_cols) if state["touch"] else (idle_lines, idle_cols)
+        else:
+            lines_delays, cols_delays = delays[(yield dut.col_id)], []
+        i = 0
+        while ( yield dut.lines_oe ) == 0 :
+            for j, d in enumerate(lines_delays):
+                if d - 1 == i :
+                    yield dut.lines_i[j].eq(1)
+            for j, d in enumerate(cols_delays):
+                if d - 1 == i :
+                    yield dut.cols_i[j].eq(1)
+            i += 1
+            yield
+        yield dut.lines_i.eq(0)
+        yield dut.cols_i.eq(0)
+
+def check(dut, name, value, expected):
+    if value != expected:
+        dut.errors += 1
+        print("Error : ", name, " expected : ", expected, "; received : ", value)
+
+def read_frame(dut):
+    frame = []
+    while ( yield dut.fifo.source.valid ) != 0 :
+        frame.append((yield from dut.capdata.read()))
+        yield
+    return frame
+
+def prescan_checker(dut, state, header):
+    yield from dut.timeout.write(timeout)
+    yield from dut.prescan_threshold.write(threshold)
+    yield from dut.prescan.write(1)
+    samples = [d for col in delays for d in col]
+    skipped = 0
+    for sequence, touch in enumerate(touched):
+        state["touch"] = touch
+        yield from dut.ctrl.write(1)
+        while ( yield dut.ctrl.storage ) != 0 :
+            yield
+        while ( yield dut.status.fields.done ) == 0 :
+            yield
+        frame = yield from read_frame(dut)
+        print("Frame ", sequence, " : ", frame)
+        if header and touch:
+            check(dut, "sequence", frame[1], sequence)
+            frame = frame[2:-1]
+        check(dut, "samples", frame, samples if touch else [])
+        skipped += not touch
+        check(dut, "skipped", (yield dut.prescan_skipped.status), skipped)
+        check(dut, "prescan_time", (yield dut.prescan_time.status), threshold if touch else max(idle_lines + idle_cols))
+
+def run(header=False, cdc=False, **kwargs):
+    dut=CapTouch(num_x_pads, num_y_pads, matrix=True, max_timeout=255, with_prescan=True, with_header=header,
+        clock_domain="capture" if cdc else "sys", **kwargs)
+    dut.errors=0
+    state = {"touch": False}
+    if cdc:
+        # Capture 2.5 times faster than sys, the pre-scan results cross to sys
+        dut.clock_domains.cd_capture = ClockDomain()
+        generators = {"sys": [prescan_checker(dut, state, header)], "capture": [touch_generator(dut, state)]}
+        run_simulation(dut, generators, clocks={"sys": 10, "capture": 4})
+    else:
+        run_simulation(dut, [touch_generator(dut, state), prescan_checker(dut, state, header)])
+    if dut.errors != 0 :
+        print("Number of errors : ", dut.errors)
+    assert dut.errors == 0
+
+def test_captouch_prescan():
+    run()
+
+def test_captouch_prescan_timestamps():
+    run(timestamps=True)
+
+def test_captouch_prescan_header():
+    # Frames without a touch leave no header
+    run(header=True)
+
+def test_captouch_prescan_clock():
+    run(cdc=True)
+
+if __name__ == "__main__":
+    test_captouch_prescan()
+    test_captouch_prescan_timestamps()
+    test_captouch_prescan_header()
+    test_captouch_prescan_clock()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from migen import *
+from mutcaptouch import CapTouch
+
+num_x_pads=5
+num_y_pads=4
+
+# x are lines, y are columns
+# Region of interest : lines 1-3 of columns 1-2 only, a full scan every 3 frames. Lines out of the
+# window never go up, a full scan ends on the timeout
+
+delays = [
+    [None, 7, 12, 4, None],
+    [None, 9, 3, 15, None],
+    [None, 5, 8, 11, None],
+    [None, 14, 6, 10, None],
+]   # Per column
+timeout = 60
+window = (1, 3, 1, 2)   # line_first, line_last, col_first, col_last
+
+@passive
+def touch_generator(dut):
+    while True:
+        while ( yield dut.lines_oe ) != 0 :
+            yield   # wait for the lines to be released (RUN)
+        col = yield dut.col_id
+        i = 0
+        while ( yield dut.lines_oe ) == 0 :
+            for j in range(num_x_pads):
+                if delays[col][j] is not None and delays[col][j] - 1 == i :
+                    yield dut.lines_i[j].eq(1)
+            i += 1
+            yield
+        for j in range(num_x_pads):
+            yield dut.lines_i[j].eq(0)
+
+def expected(full):
+    line_first, line_last, col_first, col_last = (0, num_x_pads - 1, 0, num_y_pads - 1) if full else window
+    return [timeout if delays[col][line] is None else delays[col][line]
+        for col in range(col_first, col_last + 1) for line in range(line_first, line_last + 1)]
+
+def touch_checker(dut, durations):
+    yield from dut.timeout.write(timeout)
+    yield from dut.roi_period.write(3)
+    line_first, line_last, col_first, col_last = window
+    yield from dut.roi.write(1 | (line_first << 1) | (line_last << 4) | (col_first << 7) | (col_last << 9))
+    for frame in range(5):
+        full = yield dut.roi_full.status
+        if full != (frame % 3 == 0):
+            dut.errors += 1
+            print("Error : frame ", frame, " full scan : ", full)
+        yield from dut.ctrl.write(1)
+        cycles = 0
+        while ( yield dut.ctrl.storage ) != 0 :
+            cycles += 1
+            yield
+        while ( yield dut.status.fields.done ) == 0 :
+            yield
+        durations.append((full, cycles))
+        data = []
+        while ( yield dut.fifo.source.valid ) != 0 :
+            data.append((yield from dut.capdata.read()))
+            yield
+        print("Frame ", frame, " : ", cycles, " cycles ", data)
+        if data != expected(full):
+            dut.errors += 1
+            print("Error : expected : ", expected(full), "; received : ", data)
+
+def run(timestamps):
+    dut=CapTouch(num_x_pads, num_y_pads, matrix=True, max_timeout=255, timestamps=timestamps, with_roi=True)
+    dut.errors=0
+    durations = []
+    run_simulation(dut, [touch_generator(dut), touch_checker(dut, durations)])
+    if dut.errors != 0 :
+        print("Number of errors : ", dut.errors)
+    assert dut.errors == 0
+    # Two short captures instead of four on the timeout
+    full = max(c for f, c in durations if f)
+    roi = max(c for f, c in durations if not f)
+    assert roi*4 < full
+
+def test_captouch_roi():
+    run(timestamps=False)
+
+def test_captouch_roi_timestamps():
+    run(timestamps=True)
+
+if __name__ == "__main__":
+    test_captouch_roi()
+    test_captouch_roi_timestamps()
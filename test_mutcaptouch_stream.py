@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from migen import *
+from litex.soc.interconnect import stream
+
+from mutcaptouch import CapTouch
+from mutcaptouch_model import CapTouchModel, random_rise
+
+# Frames out on the source stream (config.stream) instead of capdata : to a byte stream (as a UART
+# streamer would take them) through a converter, with back-pressure, against the NumPy model
+
+num_x_pads=4
+num_y_pads=2
+
+class StreamTop(Module):
+    def __init__(self, **kwargs):
+        self.submodules.captouch = CapTouch(num_x_pads, num_y_pads, **kwargs)
+        self.submodules.converter = stream.Converter(len(self.captouch.source.data), 8)
+        self.comb += self.captouch.source.connect(self.converter.sink)
+        self.source = self.converter.source
+
+@passive
+def touch_generator(dut, rise):
+    for frame in rise:
+        for step in range(num_y_pads):
+            while ( yield dut.lines_oe ) != 0 :
+                yield
+            i = 0
+            while ( yield dut.lines_oe ) == 0 :
+                for j in range(num_x_pads):
+                    if frame[0][step][j] - 1 == i :
+                        yield dut.lines_i[j].eq(1)
+                i += 1
+                yield
+            for j in range(num_x_pads):
+                yield dut.lines_i[j].eq(0)
+
+@passive
+def byte_reader(top, received, rng):
+    # Random back-pressure, one byte at most every other cycle
+    source = top.source
+    while True:
+        ready = int(rng.random() < 0.5)
+        yield source.ready.eq(ready)
+        yield
+        if ready and ( yield source.valid ):
+            received.append(((yield source.data), (yield source.last)))
+
+def touch_checker(top, model, frames, received):
+    dut = top.captouch
+    yield from dut.timeout.write(model.timeout)
+    yield from dut.config.write((model.pack << 2) | (1 << 4))     # Packing, stream
+    for frame in range(frames):
+        yield from dut.ctrl.write(1)
+        while ( yield dut.ctrl.storage ) != 0 :
+            yield
+        while ( yield dut.status.fields.done ) == 0 :
+            yield
+        # capdata reads do not pop the FIFO while the stream is on (no word lost)
+        yield from dut.capdata.read()
+        yield
+    while ( yield dut.frames.status ) != 0 :
+        yield
+    for i in range(10):
+        yield
+
+def test_captouch_stream():
+    model = CapTouchModel(num_x_pads, num_y_pads, matrix=True, max_timeout=255)
+    model.timeout = 100
+    model.pack = 2
+    rise = random_rise(model, 3, high=120, p_timeout=0.1, rng=21)
+    top = StreamTop(matrix=True, max_timeout=255, with_packing=True, fifo_frames=2)
+    top.errors = 0
+    received = []
+    rng = np.random.default_rng(22)
+    generators = [touch_checker(top, model, len(rise), received), touch_generator(top.captouch, rise),
+        byte_reader(top, received, rng)]
+    run_simulation(top, generators)
+    words = model.words(rise)
+    expected = [((int(w) >> (8*b)) & 0xff, int(b == 3 and i == len(f) - 1))
+        for f in words for i, w in enumerate(f) for b in range(4)]
+    print(received)
+    if received != expected:
+        top.errors += 1
+        print("Error : expected : ", expected, "; received : ", received)
+    if top.errors != 0 :
+        print("Number of errors : ", top.errors)
+    assert top.errors == 0
+
+if __name__ == "__main__":
+    test_captouch_stream()
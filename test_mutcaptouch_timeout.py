@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from migen import *
+from mutcaptouch import CapTouch
+
+num_x_pads=6
+num_y_pads=2
+
+# x are lines, y are columns
+# Line 3 never goes up : it must read as the timeout value, without waiting for max_timeout
+
+delays = [3, 9, 5, None, 7, 2]
+timeout = 20
+
+def touch_generator(dut):
+    while ( yield dut.lines_oe ) != 0 :
+        yield   # wait for the lines to be released (RUN)
+    for i in range(timeout):
+        for j in range(num_x_pads):
+            if( delays[j] == i ):
+                yield dut.lines_i[j].eq(1)      # Put line number j up
+        yield
+
+def touch_checker(dut):
+    if len(dut.capdata.w) != 8:
+        dut.errors += 1
+        print("Error : samples should be sized by max_timeout")
+    yield from dut.timeout.write(timeout)
+    yield from dut.ctrl.write(1)
+    cycles = 0
+    while ( yield dut.ctrl.storage ) != 0 :
+        cycles += 1
+        yield
+    while ( yield dut.status.fields.done ) == 0 :   # Last samples on their way to the FIFO
+        cycles += 1
+        yield
+    print("Capture done in ", cycles, " cycles")
+    if cycles > timeout + 2*num_x_pads:
+        dut.errors += 1
+    for index in range(num_x_pads):
+        data = yield from dut.capdata.read()
+        yield
+        print("Data: ", data, "index : ", index)
+        # First edge is seen one cycle after the line rises
+        expected = timeout if delays[index] is None else delays[index] + 1
+        if data != expected:
+            dut.errors += 1
+            print("Error : expected : ", expected, "; received : ", data )
+
+def test_captouch_timeout():
+    dut=CapTouch(num_x_pads, num_y_pads, max_timeout=255)
+    dut.errors=0
+    generators = [
+        touch_generator(dut),
+        touch_checker(dut)
+    ]
+    run_simulation(dut, generators)
+    if dut.errors != 0 :
+        print("Number of errors : ", dut.errors)
+    assert dut.errors == 0
+
+if __name__ == "__main__":
+    test_captouch_timeout()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from mutcaptouch import CapTouch
+from mutcaptouch_model import CapTouchModel, random_rise, check, simulate
+
+# Edge timestamps in block RAM (timestamps=True) against the NumPy model : same samples as the
+# counter registers, with lines going up together, timeouts and more lines than the 4x4 board
+
+def test_timestamps_lines():
+    model = CapTouchModel(16, 1, max_timeout=255)
+    model.timeout = 60
+    rise = random_rise(model, 1000, high=24, p_timeout=0.2, rng=5)  # Several lines per cycle
+    errors = check(CapTouch(16, 1, max_timeout=255, timestamps=True), model, rise, samples=4, rng=6)
+    print(errors)
+    assert errors == []
+
+def test_timestamps_matrix_oversampling():
+    kwargs = dict(matrix=True, max_timeout=1023, max_oversampling=4)
+    model = CapTouchModel(5, 3, **kwargs)
+    model.timeout = 200
+    model.oversampling = 2
+    for mean in [False, True]:
+        model.mean = mean
+        rise = random_rise(model, 100, high=240, p_timeout=0.1, rng=7)
+        errors = check(CapTouch(5, 3, timestamps=True, **kwargs), model, rise, samples=2, rng=8)
+        print(errors)
+        assert errors == []
+
+def test_timestamps_registers():
+    # Same words out of both architectures, the read back costs num_lines+1 cycles per capture
+    model = CapTouchModel(8, 2, matrix=True, max_timeout=255)
+    model.timeout = 100
+    rise = random_rise(model, 3, high=120, p_timeout=0.1, rng=9)
+    words, cycles, _ = simulate(CapTouch(8, 2, matrix=True, max_timeout=255), model, rise)
+    ts_words, ts_cycles, _ = simulate(CapTouch(8, 2, matrix=True, max_timeout=255, timestamps=True), model, rise)
+    print(cycles, ts_cycles)
+    assert ts_words == words
+    assert all(t <= c + 2*(8 + 1) for c, t in zip(cycles, ts_cycles))
+
+if __name__ == "__main__":
+    test_timestamps_lines()
+    test_timestamps_matrix_oversampling()
+    test_timestamps_registers()
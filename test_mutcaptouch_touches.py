@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from mutcaptouch import CapTouch
+from mutcaptouch_model import CapTouchModel, random_rise, check, simulate
+
+# Touch point extraction (with_touches=True) against the NumPy model : local maxima above the threshold,
+# 3x3 centroids, the strongest max_touches kept
+
+def touch_rise(model, frames, touches, rng=None):
+    # Low background with a few bumps (peak and its decreasing neighbours)
+    rng = np.random.default_rng(rng)
+    rise = rng.integers(1, 6, size=model.shape(frames))
+    for frame in rise:
+        for t in range(touches):
+            y, x = rng.integers(model.steps), rng.integers(model.num_lines)
+            peak = rng.integers(40, 90)
+            for dy in (-1, 0, 1):
+                for dx in (-1, 0, 1):
+                    if 0 <= y + dy < model.steps and 0 <= x + dx < model.num_lines:
+                        bump = peak >> (abs(dx) + abs(dy) + rng.integers(0, 2))
+                        frame[0][y + dy][x + dx] = max(frame[0][y + dy][x + dx], bump)
+    return rise
+
+def test_touches_matrix():
+    kwargs = dict(matrix=True, max_timeout=255, max_touches=3)
+    model = CapTouchModel(6, 5, **kwargs)
+    model.touches = True
+    model.threshold = 20
+    rise = touch_rise(model, 40, 4, rng=1)   # Sometimes more touches than kept
+    errors = check(CapTouch(6, 5, with_touches=True, **kwargs), model, rise, samples=6, rng=2)
+    print(errors)
+    assert errors == []
+
+def test_touches_lines():
+    # Not in matrix mode : one row of sensors, y = 0
+    kwargs = dict(max_timeout=255, max_touches=2, touch_frac=3)
+    model = CapTouchModel(12, 1, **kwargs)
+    model.touches = True
+    model.threshold = 10
+    rise = random_rise(model, 20, high=60, rng=3)
+    errors = check(CapTouch(12, 1, with_touches=True, **kwargs), model, rise, samples=4, rng=4)
+    print(errors)
+    assert errors == []
+
+def test_touches_disabled():
+    # ctrl.enable at 0 : the frames go through unchanged
+    model = CapTouchModel(4, 3, matrix=True, max_timeout=255)
+    rise = random_rise(model, 2, high=100, rng=5)
+    words, _, _ = simulate(CapTouch(4, 3, matrix=True, max_timeout=255, with_touches=True), model, rise)
+    assert words == [list(w) for w in model.words(rise)]
+
+if __name__ == "__main__":
+    test_touches_matrix()
+    test_touches_lines()
+    test_touches_disabled()